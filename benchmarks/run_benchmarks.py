@@ -0,0 +1,319 @@
+"""Benchmarks for the simulation engine and the GUI update path.
+
+    python benchmarks/run_benchmarks.py                        run everything and print the timings
+    python benchmarks/run_benchmarks.py --save baseline.json   store the timings as a baseline
+    python benchmarks/run_benchmarks.py --compare baseline.json --tolerance 0.2
+                                                               fail when a benchmark is 20% slower than the baseline
+    python benchmarks/run_benchmarks.py --golden               only check the engines against golden.json
+
+The golden check runs before the timings, so an optimization that changes the numbers is caught right away.
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+
+from astrid_roald_mortgage_gui.mortgage_objects import AnalysisStartValues, AnalysisVariables, Person, ScheduleChange
+from astrid_roald_mortgage_gui.mortgage_functions import SavingsSimulation, calculate_cost, date_range, simulate, \
+    sweep_mortgage_dates
+from astrid_roald_mortgage_gui.mortgage_batch import BatchPlan, calculate_cost_batch
+from astrid_roald_mortgage_gui.mortgage_cache import CostCache
+from astrid_roald_mortgage_gui.mortgage_plan import SimulationPlan
+from astrid_roald_mortgage_gui.mortgage_portfolio import PortfolioSimulation
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden.json')
+START_DATE = datetime.date(2019, 4, 1)
+
+
+def get_start_values(number_of_persons):
+    persons = [Person(datetime.date(1986 + 2 * i, 1 + i % 12, 5), f'p{i}', 8000 + 1000 * i, 100000 + 20000 * i,
+                      30000 * (i % 2), 25000, 25000) for i in range(number_of_persons)]
+    return AnalysisStartValues(persons, START_DATE, 15000, 4000000, 4.5, 2.2)
+
+
+def get_variables(analysis_start_values: AnalysisStartValues, pop_bsu=False, pop_bsu2=False, months_to_mortgage=18,
+                  property_value=None, mortgage_interest_percentage=None):
+    housing_money = {person.name: person.housing_money for person in analysis_start_values.persons}
+    mortgage_date = list(date_range(START_DATE, months_to_mortgage + 1))[-1]
+    return AnalysisVariables(sum(housing_money.values()), pop_bsu, pop_bsu2, mortgage_date,
+                             property_value or analysis_start_values.property_value,
+                             analysis_start_values.top_loan_interest_percentage,
+                             mortgage_interest_percentage or analysis_start_values.mortgage_interest_percentage,
+                             housing_money)
+
+
+def get_golden_scenarios():
+    for number_of_persons in [1, 2, 3]:
+        analysis_start_values = get_start_values(number_of_persons)
+        for pop_bsu in [False, True]:
+            for pop_bsu2 in [False, True]:
+                for months_to_mortgage in [1, 18, 60]:
+                    name = f'{number_of_persons} persons, pop {pop_bsu}/{pop_bsu2}, mortgage after ' \
+                        f'{months_to_mortgage} months'
+                    yield name, get_variables(analysis_start_values, pop_bsu, pop_bsu2, months_to_mortgage), \
+                        analysis_start_values
+    # Changes dated before the start apply from the first month, the others land before, on and after a new year
+    schedules = {
+        'rates': [ScheduleChange(datetime.date(2018, 6, 1), 'mortgage_interest_percentage', 3.),
+                  ScheduleChange(datetime.date(2021, 1, 1), 'mortgage_interest_percentage', 6.),
+                  ScheduleChange(datetime.date(2022, 6, 15), 'top_loan_interest_percentage', 5.5)],
+        'rent': [ScheduleChange(datetime.date(2019, 10, 1), 'rent', 17000),
+                 ScheduleChange(datetime.date(2023, 1, 1), 'rent', 19000)],
+        'housing money': [ScheduleChange(datetime.date(2018, 1, 1), 'housing_money', 9000, 'p0'),
+                          ScheduleChange(datetime.date(2020, 8, 1), 'housing_money', 0, 'p1')],
+        'BSU rate': [ScheduleChange(datetime.date(2018, 12, 1), 'bsu_interest_percentage', 2.5),
+                     ScheduleChange(datetime.date(2020, 1, 1), 'bsu_interest_percentage', 3.),
+                     ScheduleChange(datetime.date(2024, 7, 1), 'bsu_interest_percentage', 1.)]}
+    schedules['everything'] = [change for changes in schedules.values() for change in changes]
+    analysis_start_values = get_start_values(2)
+    for schedule_name, schedule_changes in schedules.items():
+        for pop_bsu in [False, True]:
+            for months_to_mortgage in [1, 18, 60]:
+                name = f'{schedule_name} schedule, pop {pop_bsu}, mortgage after {months_to_mortgage} months'
+                analysis_variables = get_variables(analysis_start_values, pop_bsu, pop_bsu, months_to_mortgage)
+                yield name, analysis_variables._replace(schedule_changes=schedule_changes), analysis_start_values
+
+
+def get_golden_values(result):
+    top_loan, time, cumulative_cost, total_debt, total_wealth = result
+    return {'top_loan': top_loan, 'cumulative_cost': cumulative_cost[::12] + cumulative_cost[-1:],
+            'total_debt': total_debt[::12] + total_debt[-1:], 'total_wealth': total_wealth[::12] + total_wealth[-1:]}
+
+
+def get_portfolio_outputs(number_of_months, scenarios):
+    """The golden values of scenarios simulated together as households of one PortfolioSimulation."""
+    households = [(name, number_of_months, analysis_variables, analysis_start_values)
+                  for name, analysis_variables, analysis_start_values in scenarios]
+    simulation = PortfolioSimulation(households)
+    plans = [SimulationPlan(analysis_start_values.simulation_start_date, number_of_months,
+                            analysis_start_values.persons) for _, _, _, analysis_start_values in households]
+    plan = BatchPlan(plans, [analysis_variables.mortgage_date for _, _, analysis_variables, _ in households])
+    cumulative_cost, total_debt, total_wealth = (np.zeros((len(households), plan.number_of_months)) for _ in range(3))
+
+    def record(month, cumulative_cost_this_month, started_mortgage, tax_rebate):
+        cumulative_cost[:, month] = cumulative_cost_this_month
+        total_debt[:, month] = np.where(started_mortgage, simulation.mortgage + simulation.top_loan, 0.)
+        total_wealth[:, month] = simulation.get_total_wealth(started_mortgage)
+
+    top_loan = simulation.simulate_months(plan, record)
+    return {name: get_golden_values((float(top_loan[household]), None, cumulative_cost[household].tolist(),
+                                     total_debt[household].tolist(), total_wealth[household].tolist()))
+            for household, (name, _, _, _) in enumerate(households)}
+
+
+def get_engine_outputs(number_of_months=360):
+    """The golden values of every scenario for every engine that should reproduce calculate_cost."""
+    scenarios = list(get_golden_scenarios())
+    outputs = {'calculate_cost': {}, 'calculate_cost_batch': {}, 'CostCache': {}, 'sweep_mortgage_dates': {}}
+    # One portfolio of all households with constant inputs, so households of different sizes share the arrays
+    outputs['PortfolioSimulation'] = get_portfolio_outputs(number_of_months, [
+        scenario for scenario in scenarios if not scenario[1].schedule_changes])
+    cost_cache = CostCache()
+    for name, analysis_variables, analysis_start_values in scenarios:
+        outputs['calculate_cost'][name] = get_golden_values(
+            calculate_cost(number_of_months, analysis_variables, analysis_start_values))
+        outputs['CostCache'][name] = get_golden_values(
+            cost_cache.calculate_cost(number_of_months, analysis_variables, analysis_start_values))
+        # Sweep every golden mortgage date at once, so the result is forked from a phase that went past it
+        mortgage_dates = sorted({analysis_variables.mortgage_date} | {
+            list(date_range(START_DATE, months_to_mortgage + 1))[-1] for months_to_mortgage in [1, 18, 60]})
+        results = sweep_mortgage_dates(number_of_months, analysis_variables, analysis_start_values, mortgage_dates)
+        outputs['sweep_mortgage_dates'][name] = get_golden_values(
+            results[mortgage_dates.index(analysis_variables.mortgage_date)].to_lists())
+        if analysis_variables.schedule_changes:
+            # The batch engine does not support schedules
+            continue
+        top_loan, time, cumulative_cost, total_debt, total_wealth = calculate_cost_batch(
+            number_of_months, [analysis_variables], analysis_start_values)
+        outputs['calculate_cost_batch'][name] = get_golden_values(
+            (float(top_loan[0]), time, cumulative_cost[0].tolist(), total_debt[0].tolist(),
+             total_wealth[0].tolist()))
+    return outputs
+
+
+def get_regression_failures():
+    """Edge cases the golden scenarios do not reach, described by a failure message each."""
+    failures = []
+    analysis_start_values = get_start_values(2)
+    analysis_variables = get_variables(analysis_start_values)
+    # An ending date before the start date used to make the month chunks go backwards and never finish
+    for number_of_months in [-3, 0, 1]:
+        for chunk_months in [number_of_months, 12]:
+            results = list(CostCache().simulate_chunks(number_of_months, analysis_variables, analysis_start_values,
+                                                       chunk_months=chunk_months))
+            if [len(result) for result in results] != [1]:
+                failures.append(f'simulate_chunks: {number_of_months} months in chunks of {chunk_months}')
+        if len(calculate_cost(number_of_months, analysis_variables, analysis_start_values)[2]) != 1:
+            failures.append(f'calculate_cost: {number_of_months} months')
+    # A slice that starts after the mortgage has no month to point its mortgage start at
+    result = simulate(300, get_variables(analysis_start_values, months_to_mortgage=12), analysis_start_values)
+    if result[100:200].mortgage_start_month is not None or result[5:50].mortgage_start_month != 7:
+        failures.append('SimulationResult: mortgage start month of a slice')
+    if calculate_cost_batch(120, [], analysis_start_values)[2].shape != (0, 120):
+        failures.append('calculate_cost_batch: empty batch')
+    # The closed form fast forward must stay as precise as stepping month by month, also for tiny rates
+    for mortgage_interest_percentage in [1e-9, 1e-6, 1e-3, .1]:
+        analysis_variables = get_variables(analysis_start_values,
+                                           mortgage_interest_percentage=mortgage_interest_percentage)
+        _, _, *expected = calculate_cost_batch(600, [analysis_variables], analysis_start_values)
+        _, _, *values = calculate_cost(600, analysis_variables, analysis_start_values)
+        if not all(np.allclose(value, expected_value[0], rtol=1e-9, atol=1e-6)
+                   for value, expected_value in zip(values, expected)):
+            failures.append(f'calculate_cost: fast forward at {mortgage_interest_percentage}% mortgage interest')
+    return failures
+
+
+def check_golden(update=False, rtol=1e-9):
+    outputs = get_engine_outputs()
+    if update:
+        with open(GOLDEN_PATH, 'w') as f:
+            json.dump(outputs['calculate_cost'], f, indent=1, sort_keys=True)
+        print(f'Updated {GOLDEN_PATH}')
+        return True
+    with open(GOLDEN_PATH) as f:
+        golden = json.load(f)
+    failures = []
+    for engine, scenarios in outputs.items():
+        for name, values in scenarios.items():
+            if name not in golden:
+                failures.append(f'{engine}: {name}: missing, run --update-golden')
+                continue
+            for metric, expected in golden[name].items():
+                if not np.allclose(values[metric], expected, rtol=rtol, atol=1e-6):
+                    failures.append(f'{engine}: {name}: {metric}')
+    failures += get_regression_failures()
+    for failure in failures:
+        print(f'GOLDEN MISMATCH {failure}')
+    print(f'Golden check: {len(failures)} mismatches')
+    return not failures
+
+
+def time_call(function, minimum_time=.2):
+    """Best time per call in seconds, repeated until a round takes at least minimum_time.
+
+    function can also be a (function, setup) pair, setup being the part of function that should not be timed.
+    """
+    if isinstance(function, tuple):
+        function, setup = function
+        return max(time_call(function, minimum_time) - time_call(setup, minimum_time), 0.)
+    timer = timeit.Timer(function)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * minimum_time / max(elapsed, 1e-9)))
+    return min(timer.repeat(repeat=3, number=number)) / number
+
+
+def get_engine_benchmarks():
+    benchmarks = {}
+    for number_of_months in [12, 60, 120, 300, 600]:
+        for number_of_persons in [1, 2, 8]:
+            analysis_start_values = get_start_values(number_of_persons)
+            for pop_bsu, pop_bsu2 in [(False, False), (True, False), (True, True)]:
+                analysis_variables = get_variables(analysis_start_values, pop_bsu, pop_bsu2)
+                benchmarks[f'calculate_cost months={number_of_months} persons={number_of_persons} '
+                           f'pop={int(pop_bsu)}{int(pop_bsu2)}'] = \
+                    lambda n=number_of_months, v=analysis_variables, s=analysis_start_values: calculate_cost(n, v, s)
+
+    analysis_start_values = get_start_values(2)
+    for batch_size in [1, 100, 1000]:
+        analysis_variables_list = [get_variables(analysis_start_values, i % 2 == 0, i % 3 == 0, 1 + i % 48,
+                                                 3000000 + 1000 * i, 1.5 + i % 7 / 2) for i in range(batch_size)]
+        benchmarks[f'calculate_cost_batch months=300 batch={batch_size}'] = \
+            lambda v=analysis_variables_list: calculate_cost_batch(300, v, analysis_start_values)
+    mortgage_dates = list(date_range(START_DATE, 121))
+    benchmarks['sweep_mortgage_dates months=360 dates=120'] = \
+        lambda: sweep_mortgage_dates(360, get_variables(analysis_start_values), analysis_start_values, mortgage_dates)
+
+    # Both methods change the simulation, every call gets a fresh copy whose cost is subtracted again
+    simulation = SavingsSimulation(get_variables(analysis_start_values), analysis_start_values)
+    month_money = {person.name: 1000. for person in analysis_start_values.persons}
+    benchmarks['SavingsSimulation.top_up_bsus'] = (lambda: simulation.copy().top_up_bsus(dict(month_money)),
+                                                   lambda: (simulation.copy(), dict(month_money)))
+    benchmarks['SavingsSimulation.new_bsu_year'] = (lambda: simulation.copy().new_bsu_year(), simulation.copy)
+    benchmarks['date_range months=600'] = lambda: list(date_range(START_DATE, 600))
+    return benchmarks
+
+
+def get_gui_benchmarks():
+    """End to end latency of change_current_cost_line on the offscreen Qt platform, empty without PySide2."""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        from PySide2 import QtWidgets
+        from astrid_roald_mortgage_gui.mortgage_gui import MortgagePlotter
+    except ImportError as e:
+        print(f'Skipping GUI benchmarks: {e}')
+        return {}
+    QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    benchmarks = {}
+    for saved_lines in [0, 50]:
+        # An empty store of its own, so the saved lines of the user are not plotted as well
+        store_directory = tempfile.TemporaryDirectory()
+        plotter = MortgagePlotter(get_start_values(2), store_directory=store_directory.name)
+        for _ in range(saved_lines):
+            plotter.add_cost_line()
+        widgets = plotter.analysis_variable_widgets
+        property_values = iter(range(3000000, 10 ** 9, 1000))
+
+        def change_current_cost_line(plotter=plotter, widgets=widgets, property_values=property_values,
+                                     store_directory=store_directory):
+            # Bypass the debounce timer and worker thread, this measures the simulation and redraw itself
+            widgets.property_value_widget.blockSignals(True)
+            widgets.property_value_widget.setText(str(next(property_values)))
+            widgets.property_value_widget.blockSignals(False)
+            analysis_variables = widgets.get_analysis_variables()
+            result = plotter.cost_cache.simulate(plotter.get_number_of_months(), analysis_variables,
+                                                 plotter.analysis_start_values)
+            plotter.change_current_cost_line(plotter.cost_calculator.latest_request, analysis_variables, result)
+            QtWidgets.QApplication.processEvents()
+        benchmarks[f'MortgagePlotter.change_current_cost_line saved_lines={saved_lines}'] = change_current_cost_line
+    return benchmarks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--save', help='write the timings to this baseline file')
+    parser.add_argument('--compare', help='compare the timings against this baseline file')
+    parser.add_argument('--tolerance', type=float, default=.2, help='allowed slowdown relative to the baseline')
+    parser.add_argument('--filter', default='', help='only run benchmarks whose name contains this text')
+    parser.add_argument('--golden', action='store_true', help='only run the golden output check')
+    parser.add_argument('--update-golden', action='store_true', help='rewrite golden.json from calculate_cost')
+    parser.add_argument('--no-gui', action='store_true', help='skip the GUI benchmarks')
+    args = parser.parse_args(argv)
+
+    golden_ok = check_golden(update=args.update_golden)
+    if args.golden or args.update_golden:
+        return 0 if golden_ok else 1
+
+    benchmarks = get_engine_benchmarks()
+    if not args.no_gui:
+        benchmarks.update(get_gui_benchmarks())
+    timings = {}
+    for name, function in benchmarks.items():
+        if args.filter in name:
+            timings[name] = time_call(function)
+            print(f'{timings[name] * 1000:12.3f} ms  {name}')
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(timings, f, indent=1, sort_keys=True)
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for name, seconds in timings.items():
+            if name in baseline:
+                ratio = seconds / baseline[name]
+                print(f'{ratio:8.2f}x  {name}')
+                if ratio > 1 + args.tolerance:
+                    regressions.append(name)
+        for name in regressions:
+            print(f'REGRESSION {name}')
+    return 0 if golden_ok and not regressions else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
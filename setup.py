@@ -18,7 +18,8 @@ VERSION = None
 # What packages are required for this module to be executed?
 REQUIRED = [
     'pyside2',
-    'matplotlib'
+    'matplotlib',
+    'numpy'
 ]
 
 # What packages are optional?
@@ -66,6 +67,12 @@ setup(
     extras_require=EXTRAS,
     tests_require=TEST_REQUIRES,
     include_package_data=True,
+    entry_points={
+        'console_scripts': ['astrid-roald-mortgage=astrid_roald_mortgage_gui.mortgage_cli:main',
+                            'astrid-roald-mortgage-portfolio=astrid_roald_mortgage_gui.mortgage_portfolio:main',
+                            'astrid-roald-mortgage-server=astrid_roald_mortgage_gui.mortgage_server:main'],
+        'gui_scripts': ['astrid-roald-mortgage-gui=astrid_roald_mortgage_gui.mortgage_gui:run_app'],
+    },
     license='MIT',
     classifiers=[
         # Trove classifiers
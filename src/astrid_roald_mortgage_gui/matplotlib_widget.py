@@ -1,12 +1,19 @@
 from PySide2 import QtWidgets
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
+from matplotlib.legend import Legend
+from matplotlib.transforms import Bbox
 
 
 class MyMplCanvas(FigureCanvas):
-    """This is a QWidget (as well as a FigureCanvasAgg, etc.)."""
+    """This is a QWidget (as well as a FigureCanvasAgg, etc.).
 
-    def __init__(self, parent=None, width=5, height=3, dpi=100):
+    In interactive mode the current line and its legend entry are animated artists. Everything else (saved lines,
+    grid, axes and their legend) is cached as a background after every full draw, so updating the current line only
+    blits the animated artists on top of it. A full draw only happens when the current line leaves the axes limits.
+    """
+
+    def __init__(self, parent=None, width=5, height=3, dpi=100, interactive=False):
         self.fig = Figure(figsize=(width, height), dpi=dpi)
         self.axes = self.fig.add_subplot(111)
         self.axes.grid(alpha=.5, linestyle='--', linewidth=.5)
@@ -17,3 +24,110 @@ class MyMplCanvas(FigureCanvas):
 
         FigureCanvas.setSizePolicy(self, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
         FigureCanvas.updateGeometry(self)
+
+        self.interactive = interactive
+        self.current_line = None
+        self.current_legend = None
+        self.show_legend = False
+        self.band = None
+        self.image = None
+        self.colorbar = None
+        self.background = None
+        self.mpl_connect('draw_event', self.on_draw)
+
+    def set_current_line(self, line, show_legend=False):
+        """Make line the current line, the previous current line becomes a saved line."""
+        if self.current_line is not None:
+            self.current_line.set_animated(False)
+        self.current_line = line
+        self.show_legend = show_legend
+        if not self.interactive:
+            return
+        line.set_animated(True)
+        if self.current_legend is not None:
+            self.current_legend.remove()
+            self.current_legend = None
+        if show_legend:
+            saved_lines = [saved_line for saved_line in self.axes.lines if saved_line is not line]
+            if saved_lines:
+                self.axes.legend(handles=saved_lines, loc='lower right')
+            self.current_legend = Legend(self.axes, [line], [line.get_label()], loc='upper left')
+            self.current_legend.set_animated(True)
+            self.axes.add_artist(self.current_legend)
+
+    def set_current_label(self, label):
+        self.current_line.set_label(label)
+        if not self.show_legend:
+            return
+        if self.current_legend is None:
+            self.axes.legend()
+        else:
+            self.current_legend.texts[0].set_text(label)
+
+    def clear_saved_lines(self):
+        """Remove every line but the current line."""
+        for line in list(self.axes.lines):
+            if line is not self.current_line:
+                line.remove()
+        if self.axes.get_legend() is not None:
+            self.axes.get_legend().remove()
+        if self.current_line is not None:
+            self.set_current_line(self.current_line, self.show_legend)
+        self.redraw()
+
+    def set_band(self, time, lower, upper):
+        """Shade the area between lower and upper, replacing the previous band."""
+        if self.band is not None:
+            self.band.remove()
+        self.band = self.axes.fill_between(time, lower, upper, alpha=.2, linewidth=0)
+
+    def set_image(self, x_values, y_values, values, x_range, y_range):
+        """Show values on the grid of x_values and y_values as an image, keeping the view at x_range and y_range."""
+        half_x_step = (x_values[1] - x_values[0]) / 2 if len(x_values) > 1 else .5
+        half_y_step = (y_values[1] - y_values[0]) / 2 if len(y_values) > 1 else .5
+        extent = [x_values[0] - half_x_step, x_values[-1] + half_x_step, y_values[0] - half_y_step,
+                  y_values[-1] + half_y_step]
+        if self.image is None:
+            self.axes.grid(False)
+            self.image = self.axes.imshow(values, extent=extent, origin='lower', aspect='auto',
+                                          interpolation='nearest')
+            self.colorbar = self.fig.colorbar(self.image, ax=self.axes)
+        else:
+            self.image.set_data(values)
+            self.image.set_extent(extent)
+        self.image.autoscale()
+        self.colorbar.update_normal(self.image)
+        self.axes.set_xlim(*x_range)
+        self.axes.set_ylim(*y_range)
+        self.draw_idle()
+
+    def get_animated_artists(self):
+        return [artist for artist in [self.current_line, self.current_legend] if artist is not None]
+
+    def on_draw(self, event):
+        if not self.interactive:
+            return
+        self.background = self.copy_from_bbox(self.fig.bbox)
+        for artist in self.get_animated_artists():
+            self.fig.draw_artist(artist)
+
+    def redraw(self):
+        self.axes.relim()
+        self.axes.autoscale_view()
+        self.draw()
+
+    def current_line_in_view(self):
+        data_limits = Bbox.null()
+        data_limits.update_from_data_xy(self.current_line.get_xydata())
+        view_limits = self.axes.viewLim
+        return (view_limits.x0 <= data_limits.x0 and data_limits.x1 <= view_limits.x1 and
+                view_limits.y0 <= data_limits.y0 and data_limits.y1 <= view_limits.y1)
+
+    def redraw_current_line(self):
+        if not self.interactive or self.background is None or not self.current_line_in_view():
+            self.redraw()
+            return
+        self.restore_region(self.background)
+        for artist in self.get_animated_artists():
+            self.fig.draw_artist(artist)
+        self.blit(self.fig.bbox)
@@ -0,0 +1,280 @@
+import numpy as np
+
+from astrid_roald_mortgage_gui.mortgage_objects import AnalysisStartValues
+from astrid_roald_mortgage_gui.mortgage_functions import date_range, get_monthly_interest_from_yearly
+from astrid_roald_mortgage_gui.mortgage_plan import SimulationPlan
+
+
+class BatchSavingsSimulation:
+    """The rules of SavingsSimulation applied to many scenarios at once.
+
+    All scenarios share the same AnalysisStartValues, scenario state lives in arrays of shape (scenarios,) and
+    person state in arrays of shape (scenarios, persons). Every operation mirrors a month of the scalar
+    implementation step by step. The scalar engine skips steady months with closed form formulas though, so the
+    results agree with calculate_cost within the relative tolerance of 1e-9 of the golden check, not exactly.
+    """
+
+    def __init__(self, analysis_variables_list, analysis_start_values: AnalysisStartValues):
+        if any(variables.schedule_changes for variables in analysis_variables_list):
+            raise ValueError('The batch simulation assumes constant inputs, simulate scheduled changes with simulate')
+        number_of_scenarios = len(analysis_variables_list)
+        self.names = [person.name for person in analysis_start_values.persons]
+        self.property_value = np.array([variables.property_value for variables in analysis_variables_list], float)
+        self.mortgage = np.zeros(number_of_scenarios)
+        self.top_loan = np.zeros(number_of_scenarios)
+
+        self.rent = analysis_start_values.rent
+        self.regular_savings = np.full(number_of_scenarios, analysis_start_values.deposit, dtype=float)
+
+        def person_state(attribute, dtype=float):
+            values = [getattr(person, attribute) for person in analysis_start_values.persons]
+            return np.tile(np.array(values, dtype=dtype), (number_of_scenarios, 1))
+
+        self.bsu, self.bsu2 = person_state('bsu'), person_state('bsu2')
+        self.bsu_active, self.bsu2_active = person_state('bsu_active', bool), person_state('bsu2_active', bool)
+        self.bsu_left_to_fill = person_state('bsu_left_to_fill')
+        self.bsu2_left_to_fill = person_state('bsu2_left_to_fill')
+        self.maximum_bsu_left_to_fill_this_year = person_state('maximum_bsu_left_to_fill_this_year')
+        self.housing_money = np.array([[variables.housing_money[name] for name in self.names]
+                                       for variables in analysis_variables_list], float).reshape(-1, len(self.names))
+        self.total_housing_money = np.array([variables.total_housing_money for variables in analysis_variables_list],
+                                            float)
+
+        self.bsu_interest = get_monthly_interest_from_yearly(analysis_start_values.bsu_interest_percentage)
+        self.mortgage_interest = np.array([get_monthly_interest_from_yearly(variables.mortgage_interest_percentage)
+                                           for variables in analysis_variables_list])
+        self.top_loan_interest = np.array([get_monthly_interest_from_yearly(variables.top_loan_interest_percentage)
+                                           for variables in analysis_variables_list])
+        self.pop_bsu = np.array([variables.pop_bsu for variables in analysis_variables_list], bool)
+        self.pop_bsu2 = np.array([variables.pop_bsu2 for variables in analysis_variables_list], bool)
+
+    @staticmethod
+    def sum_persons(values):
+        # Summed column by column to keep the exact floating point order of the scalar sum()
+        total = np.zeros(values.shape[0])
+        for column in range(values.shape[1]):
+            total = total + values[:, column]
+        return total
+
+    def set_interest_percentages(self, mortgage_interest_percentage, top_loan_interest_percentage,
+                                 bsu_interest_percentage):
+        self.mortgage_interest = get_monthly_interest_from_yearly(mortgage_interest_percentage)
+        self.top_loan_interest = get_monthly_interest_from_yearly(top_loan_interest_percentage)
+        self.bsu_interest = get_monthly_interest_from_yearly(bsu_interest_percentage)
+
+    def get_total_bsu_value(self):
+        return self.sum_persons(self.bsu), self.sum_persons(self.bsu2)
+
+    def get_bsu_interest_for_one_month(self, interest_so_far):
+        bsu_total, bsu2_total = self.get_total_bsu_value()
+        return interest_so_far + ((bsu_total + bsu2_total + interest_so_far) * self.bsu_interest)
+
+    def get_bsu_interest_for_several_months(self, months):
+        bsu_total, bsu2_total = self.get_total_bsu_value()
+        return (bsu_total + bsu2_total) * ((1 + self.bsu_interest) ** months - 1)
+
+    def get_month_cost(self, got_mortgage, this_months_money):
+        interest_cost = (self.mortgage * self.mortgage_interest + self.top_loan * self.top_loan_interest) * .78
+        mortgage_money = this_months_money - (interest_cost[:, None] * this_months_money
+                                              / self.total_housing_money[:, None])
+        rent_money = this_months_money - self.rent / this_months_money.shape[1]
+        month_cost = np.where(got_mortgage, interest_cost, float(self.rent))
+        return month_cost, np.where(got_mortgage[:, None], mortgage_money, rent_money)
+
+    def top_up_bsus(self, this_months_money, mask):
+        fill = mask[:, None] & (self.bsu_left_to_fill > 0) & self.bsu_active
+        fill2 = mask[:, None] & (self.bsu2_left_to_fill > 0) & self.bsu2_active
+        # Both fills start from the same money, the second one overrides what is left after the first one
+        money, self.bsu, self.bsu_left_to_fill = self.do_bsu_fill(
+            fill, this_months_money, this_months_money, self.bsu, self.bsu_left_to_fill)
+        money, self.bsu2, self.bsu2_left_to_fill = self.do_bsu_fill(
+            fill2, money, this_months_money, self.bsu2, self.bsu2_left_to_fill)
+        return money
+
+    @staticmethod
+    def do_bsu_fill(mask, current_money, month_leftover_money, bsu, bsu_left_to_fill):
+        partial = bsu_left_to_fill - month_leftover_money > 0
+        new_bsu = np.where(partial, bsu + month_leftover_money, bsu + bsu_left_to_fill)
+        new_left = np.where(partial, bsu_left_to_fill - month_leftover_money, 0.)
+        new_money = np.where(partial, 0., month_leftover_money - bsu_left_to_fill)
+        return (np.where(mask, new_money, current_money), np.where(mask, new_bsu, bsu),
+                np.where(mask, new_left, bsu_left_to_fill))
+
+    def empty_savings(self, mask):
+        spendable_savings = np.where(mask, self.regular_savings, 0.)
+        self.regular_savings = np.where(mask, 0., self.regular_savings)
+        popping, popping2 = mask & self.pop_bsu, mask & self.pop_bsu2
+        for column in range(self.bsu.shape[1]):
+            spendable_savings = np.where(popping, spendable_savings + self.bsu[:, column], spendable_savings)
+            spendable_savings = np.where(popping2, spendable_savings + self.bsu2[:, column], spendable_savings)
+        for pop, bsu, active in [(popping, self.bsu, self.bsu_active), (popping2, self.bsu2, self.bsu2_active)]:
+            bsu[pop] = 0
+            active[pop] = False
+        return spendable_savings
+
+    def start_mortgage(self, mask):
+        maximum_mortgage = self.property_value * .85 + np.where(self.pop_bsu, 0., self.get_total_bsu_value()[0])
+        spendable_savings = self.empty_savings(mask)
+        self.mortgage = np.where(mask, np.minimum(maximum_mortgage, self.property_value - spendable_savings),
+                                 self.mortgage)
+        self.top_loan = np.where(mask, np.maximum(self.property_value - spendable_savings - maximum_mortgage, 0),
+                                 self.top_loan)
+
+    def pay_down_debt(self, this_months_money, mask):
+        combined_money = self.sum_persons(this_months_money)
+        top_loan_left = mask & (self.top_loan > combined_money)
+        top_loan_cleared = mask & ~top_loan_left & (self.top_loan != 0)
+        mortgage_left = mask & ~top_loan_left & ~top_loan_cleared & (self.mortgage > combined_money)
+        mortgage_cleared = mask & ~top_loan_left & ~top_loan_cleared & ~mortgage_left & (self.mortgage != 0)
+        saving = mask & ~top_loan_left & ~top_loan_cleared & ~mortgage_left & ~mortgage_cleared
+
+        mortgage = np.where(top_loan_cleared, self.mortgage + (self.top_loan - combined_money), self.mortgage)
+        mortgage = np.where(mortgage_left, self.mortgage - combined_money, mortgage)
+        self.mortgage = np.where(mortgage_cleared, 0., mortgage)
+        self.top_loan = np.where(top_loan_left, self.top_loan - combined_money,
+                                 np.where(top_loan_cleared, 0., self.top_loan))
+        self.regular_savings = np.where(saving, self.regular_savings + combined_money, self.regular_savings)
+
+    def new_bsu_year(self, mask):
+        """The yearly BSU rollover for the scenarios in mask, returns their tax rebate per person."""
+        rebating = mask[:, None] & (self.bsu > 0)
+        bsu_tax_rebate = np.where(rebating, (self.maximum_bsu_left_to_fill_this_year - self.bsu_left_to_fill) * .2,
+                                  0.)
+        yearly_growth = np.reshape((1 + self.bsu_interest) ** 12, (-1, 1))
+        for bsu, left_to_fill, active in [(self.bsu, self.bsu_left_to_fill, self.bsu_active),
+                                          (self.bsu2, self.bsu2_left_to_fill, self.bsu2_active)]:
+            rolling = active & mask[:, None]
+            bsu[rolling] = (bsu * yearly_growth)[rolling]
+            left_to_fill[rolling] = np.minimum(25000, np.maximum(300000 - bsu[rolling], 0))
+        rolling = self.bsu_active & mask[:, None]
+        self.maximum_bsu_left_to_fill_this_year[rolling] = self.bsu_left_to_fill[rolling]
+        return bsu_tax_rebate
+
+    def kill_bsus(self, person_mask):
+        extra_money = np.where(person_mask, self.bsu + self.bsu2, 0.)
+        self.bsu = np.where(person_mask, 0., self.bsu)
+        self.bsu2 = np.where(person_mask, 0., self.bsu2)
+        self.bsu_active = self.bsu_active & ~person_mask
+        self.bsu2_active = self.bsu2_active & ~person_mask
+        return extra_money
+
+    def get_total_wealth(self, started_mortgage):
+        bsu_total, bsu2_total = self.get_total_bsu_value()
+        savings = self.regular_savings + (bsu_total + bsu2_total)
+        return np.where(started_mortgage, savings + self.property_value - self.mortgage - self.top_loan, savings)
+
+    def simulate_months(self, plan, record, interest_rate_paths=None):
+        """Simulate every scenario month by month along its row of plan, a BatchPlan.
+
+        record(month, cumulative_cost, started_mortgage, tax_rebate) is called after the start and after every
+        month, with arrays of shape (scenarios,). Scenarios are simulated up to the longest horizon of the plan,
+        record ignores the months beyond their own. Returns the top loan at the start of each mortgage, nan where
+        the mortgage does not start.
+        """
+        number_of_scenarios = len(plan.horizons)
+        top_up_after_mortgage = ~(self.pop_bsu & self.pop_bsu2)
+        starting_top_loan = np.full(number_of_scenarios, np.nan)
+        cumulative_cost = np.zeros(number_of_scenarios)
+        started_mortgage = np.zeros(number_of_scenarios, bool)
+
+        if interest_rate_paths is not None:
+            self.set_interest_percentages(*(path[:, 0] for path in interest_rate_paths))
+        bsu_interest_this_year = self.get_bsu_interest_for_several_months(plan.start_months)
+        record(0, cumulative_cost, started_mortgage, np.zeros(number_of_scenarios))
+
+        for month in range(1, plan.number_of_months):
+            if interest_rate_paths is not None:
+                self.set_interest_percentages(*(path[:, month] for path in interest_rate_paths))
+            this_months_money = self.housing_money
+            this_months_cost, this_months_money = self.get_month_cost(started_mortgage, this_months_money)
+            cumulative_cost = this_months_cost + cumulative_cost
+
+            tax_rebate = np.zeros(number_of_scenarios)
+            if month in plan.new_years:
+                new_year = plan.new_years[month]
+                bsu_tax_rebate = self.new_bsu_year(new_year)
+                tax_rebate = self.sum_persons(bsu_tax_rebate)
+                cumulative_cost = np.where(new_year, cumulative_cost - bsu_interest_this_year - tax_rebate,
+                                           cumulative_cost)
+                bsu_interest_this_year = np.where(new_year, 0., self.get_bsu_interest_for_one_month(
+                    bsu_interest_this_year))
+                this_months_money = this_months_money + bsu_tax_rebate
+            else:
+                bsu_interest_this_year = self.get_bsu_interest_for_one_month(bsu_interest_this_year)
+
+            if month in plan.bsu_cutoffs:
+                this_months_money = this_months_money + self.kill_bsus(plan.bsu_cutoffs[month])
+
+            saving = month < plan.mortgage_start_months
+            starting = ~saving & ~started_mortgage
+            if starting.any():
+                self.start_mortgage(starting)
+                started_mortgage = started_mortgage | starting
+                starting_top_loan = np.where(starting, self.top_loan, starting_top_loan)
+            this_months_money = self.top_up_bsus(this_months_money, saving | top_up_after_mortgage)
+            self.regular_savings = np.where(saving, self.regular_savings + self.sum_persons(this_months_money),
+                                            self.regular_savings)
+            self.pay_down_debt(this_months_money, ~saving)
+            record(month, cumulative_cost, started_mortgage, tax_rebate)
+        return starting_top_loan
+
+
+class BatchPlan:
+    """The SimulationPlan of every scenario of a batch compiled to arrays, so the month loop handles all at once.
+
+    Month indices are relative to the start of each scenario. new_years and bsu_cutoffs map the months in which the
+    event happens for at least one scenario to a mask of the scenarios, or scenarios and persons, it happens to.
+    Scenarios that share a SimulationPlan object are compiled together.
+    """
+
+    def __init__(self, plans, mortgage_dates):
+        number_of_scenarios = len(plans)
+        self.horizons = np.array([plan.number_of_months for plan in plans], int)
+        # An empty batch still has the month the simulation starts in
+        self.number_of_months = int(self.horizons.max()) if plans else 1
+        self.start_months = np.array([plan.simulation_start_date.month for plan in plans], int)
+        self.mortgage_start_months = np.array([plan.number_of_months if mortgage_date is None else
+                                               plan.get_first_month_from(mortgage_date)
+                                               for plan, mortgage_date in zip(plans, mortgage_dates)], int)
+        scenarios_per_plan = {}
+        for scenario, plan in enumerate(plans):
+            scenarios_per_plan.setdefault(id(plan), (plan, []))[1].append(scenario)
+        number_of_persons = max((len(plan.bsu_cutoff_months) for plan in plans), default=0)
+        self.new_years = {}
+        self.bsu_cutoffs = {}
+        for plan, scenarios in scenarios_per_plan.values():
+            for month in plan.new_year_months:
+                self.new_years.setdefault(month, np.zeros(number_of_scenarios, bool))[scenarios] = True
+            for person, month in enumerate(plan.bsu_cutoff_months.values()):
+                cutoffs = self.bsu_cutoffs.setdefault(month, np.zeros((number_of_scenarios, number_of_persons), bool))
+                cutoffs[scenarios, person] = True
+
+
+def calculate_cost_batch(number_of_months, analysis_variables_list, analysis_start_values: AnalysisStartValues,
+                         interest_rate_paths=None):
+    """Vectorized calculate_cost for many AnalysisVariables sharing the same AnalysisStartValues.
+
+    interest_rate_paths optionally replaces the constant interest rates by a tuple of mortgage, top loan and BSU
+    yearly interest percentages, each with shape (scenarios, months).
+
+    Returns top_loan with shape (scenarios,), the shared list of dates and cost, debt and wealth arrays with shape
+    (scenarios, months). The top loan is nan for scenarios where the mortgage does not start within the horizon.
+    """
+    simulation = BatchSavingsSimulation(analysis_variables_list, analysis_start_values)
+    number_of_scenarios = len(analysis_variables_list)
+    start_date = analysis_start_values.simulation_start_date
+    plan = SimulationPlan(start_date, number_of_months, analysis_start_values.persons)
+    time = [start_date] + list(date_range(start_date, number_of_months))
+    cumulative_cost = np.zeros((number_of_scenarios, len(time)))
+    total_debt = np.zeros((number_of_scenarios, len(time)))
+    total_wealth = np.zeros((number_of_scenarios, len(time)))
+
+    def record(month, cumulative_cost_this_month, started_mortgage, tax_rebate):
+        cumulative_cost[:, month] = cumulative_cost_this_month
+        total_debt[:, month] = np.where(started_mortgage, simulation.mortgage + simulation.top_loan, 0.)
+        total_wealth[:, month] = simulation.get_total_wealth(started_mortgage)
+
+    top_loan = simulation.simulate_months(
+        BatchPlan([plan] * number_of_scenarios, [variables.mortgage_date for variables in analysis_variables_list]),
+        record, interest_rate_paths)
+    return top_loan, time, cumulative_cost, total_debt, total_wealth
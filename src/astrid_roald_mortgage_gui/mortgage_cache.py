@@ -0,0 +1,76 @@
+import collections
+import threading
+
+from astrid_roald_mortgage_gui.mortgage_objects import AnalysisStartValues, AnalysisVariables
+from astrid_roald_mortgage_gui.mortgage_functions import simulate_chunks
+
+CacheInfo = collections.namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+def get_scenario_key(analysis_variables: AnalysisVariables, analysis_start_values: AnalysisStartValues):
+    """A hashable snapshot of everything calculate_cost depends on, apart from the number of months.
+
+    The inputs are immutable, so they are their own snapshot.
+    """
+    return analysis_variables, analysis_start_values
+
+
+class CostCache:
+    """Bounded least recently used memoization of calculate_cost.
+
+    Scenarios are cached independent of the horizon, a request for fewer months than already computed is served
+    by slicing the longer result.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.results = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def simulate_chunks(self, number_of_months, analysis_variables: AnalysisVariables,
+                        analysis_start_values: AnalysisStartValues, chunk_months=12):
+        """Cached mortgage_functions.simulate_chunks, a cached scenario is yielded as a single chunk."""
+        key = get_scenario_key(analysis_variables, analysis_start_values)
+        months = max(number_of_months, 1)
+        with self.lock:
+            cached = self.results.get(key)
+            if cached is not None and len(cached) >= months:
+                self.hits += 1
+                self.results.move_to_end(key)
+            else:
+                cached = None
+                self.misses += 1
+        if cached is not None:
+            yield cached[:months]
+            return
+
+        for result in simulate_chunks(number_of_months, analysis_variables, analysis_start_values, chunk_months):
+            yield result
+        with self.lock:
+            self.results[key] = result
+            self.results.move_to_end(key)
+            while len(self.results) > self.maxsize:
+                self.results.popitem(last=False)
+
+    def simulate(self, number_of_months, analysis_variables: AnalysisVariables,
+                 analysis_start_values: AnalysisStartValues):
+        for result in self.simulate_chunks(number_of_months, analysis_variables, analysis_start_values,
+                                           number_of_months):
+            pass
+        return result
+
+    def calculate_cost(self, number_of_months, analysis_variables: AnalysisVariables,
+                       analysis_start_values: AnalysisStartValues):
+        return self.simulate(number_of_months, analysis_variables, analysis_start_values).to_lists()
+
+    def cache_info(self):
+        with self.lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self.results))
+
+    def cache_clear(self):
+        with self.lock:
+            self.results.clear()
+            self.hits = 0
+            self.misses = 0
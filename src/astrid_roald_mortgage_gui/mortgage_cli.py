@@ -0,0 +1,62 @@
+import argparse
+import sqlite3
+import sys
+
+from astrid_roald_mortgage_gui.mortgage_functions import simulate
+from astrid_roald_mortgage_gui.mortgage_io import RESULT_FIELDS, SUMMARY_FIELDS, get_result_rows, get_summary_rows, \
+    get_writer, read_scenarios
+from astrid_roald_mortgage_gui.mortgage_parallel import map_chunks
+from astrid_roald_mortgage_gui.mortgage_store import ResultStore
+
+
+def simulate_chunk(scenarios, summary, store_directory=None):
+    get_rows = get_summary_rows if summary else get_result_rows
+    store = ResultStore(store_directory) if store_directory else None
+    rows = []
+    try:
+        for scenario_id, number_of_months, analysis_variables, analysis_start_values in scenarios:
+            result = store.simulate(number_of_months, analysis_variables, analysis_start_values) if store else \
+                simulate(number_of_months, analysis_variables, analysis_start_values)
+            rows += get_rows(scenario_id, result)
+    finally:
+        if store:
+            store.close()
+    return rows
+
+
+def run_scenarios(input_path, output_path, summary=False, workers=None, chunk_size=100, store_directory=None):
+    """Simulate every scenario of input_path and stream the results to output_path in input order.
+
+    The scenarios are simulated in chunks on worker processes with map_chunks. With a store_directory, scenarios
+    that are already in that ResultStore are read from it instead of simulated and new results are added to it.
+    """
+    writer = get_writer(output_path, SUMMARY_FIELDS if summary else RESULT_FIELDS)
+    try:
+        for rows in map_chunks(simulate_chunk, read_scenarios(input_path), chunk_size, workers, summary,
+                               store_directory):
+            writer.write(rows)
+    finally:
+        writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate mortgage scenarios without the GUI. Scenarios are read '
+                                                 'from JSONL or CSV, results are written to JSONL, CSV or Parquet '
+                                                 'depending on the file extension.')
+    parser.add_argument('input', help='scenarios as .jsonl or .csv')
+    parser.add_argument('output', help='results as .jsonl, .csv or .parquet')
+    parser.add_argument('--summary', action='store_true', help='write one row per scenario instead of per month')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes, default all cores')
+    parser.add_argument('--chunk-size', type=int, default=100, help='scenarios per worker task')
+    parser.add_argument('--store', metavar='DIRECTORY', default=None,
+                        help='reuse and keep results in this result store, skipping scenarios computed before')
+    args = parser.parse_args(argv)
+    try:
+        run_scenarios(args.input, args.output, args.summary, args.workers, args.chunk_size, args.store)
+    except (OSError, ValueError, ImportError, sqlite3.Error) as e:
+        parser.exit(1, f'{parser.prog}: error: {e}\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
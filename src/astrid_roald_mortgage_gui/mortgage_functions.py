@@ -1,15 +1,102 @@
-import copy
+import bisect
+import collections
 import datetime
+import math
 
-from astrid_roald_mortgage_gui.mortgage_objects import AnalysisStartValues, AnalysisVariables
+import numpy as np
+
+from astrid_roald_mortgage_gui import mortgage_profiling
+from astrid_roald_mortgage_gui.mortgage_objects import AnalysisStartValues, AnalysisVariables, Person
+from astrid_roald_mortgage_gui.mortgage_plan import SimulationPlan
+from astrid_roald_mortgage_gui.mortgage_results import SimulationResult
+
+# Increase whenever a change to the simulation changes its results, stored results of older engines are ignored
+ENGINE_VERSION = 1
+INTEREST_ATTRIBUTES = {'mortgage_interest_percentage': 'mortgage_interest',
+                       'top_loan_interest_percentage': 'top_loan_interest', 'bsu_interest_percentage': 'bsu_interest'}
+MonthState = collections.namedtuple('MonthState', ['month', 'date', 'cumulative_cost', 'total_debt', 'total_wealth',
+                                                   'top_loan', 'bsu', 'bsu2'])
 
 
 def get_monthly_interest_from_yearly(yearly_interest_percentage: float) -> float:
     return (1+(yearly_interest_percentage/100))**(1/12)-1
 
 
+class RateSchedule:
+    """A yearly interest percentage that changes in some months, compiled to monthly interests.
+
+    Segment i runs at monthly interest interests[i] from month starts[i] up to the next start, the first segment also
+    covers the months before the simulation starts. growth[i] is the compounding factor of all segments before
+    segment i, so compounding over any number of months takes two lookups instead of a loop over the months.
+    """
+    __slots__ = ('starts', 'interests', 'growth')
+
+    def __init__(self, yearly_interest_percentage, scheduled_values):
+        self.starts = [0]
+        self.interests = [get_monthly_interest_from_yearly(yearly_interest_percentage)]
+        for month, percentage in scheduled_values:
+            if month == self.starts[-1]:
+                self.interests[-1] = get_monthly_interest_from_yearly(percentage)
+            else:
+                self.starts.append(month)
+                self.interests.append(get_monthly_interest_from_yearly(percentage))
+        self.growth = [1.]
+        for segment in range(1, len(self.starts)):
+            self.growth.append(self.growth[-1] * (1 + self.interests[segment - 1])
+                               ** (self.starts[segment] - self.starts[segment - 1]))
+
+    def get_segment(self, month):
+        return max(bisect.bisect_right(self.starts, month) - 1, 0)
+
+    def get_interest(self, month):
+        return self.interests[self.get_segment(month)]
+
+    def get_growth_until(self, month):
+        segment = self.get_segment(month)
+        return self.growth[segment] * (1 + self.interests[segment]) ** (month - self.starts[segment])
+
+    def get_growth(self, first_month, last_month):
+        """The compounding factor of the months from first_month up to, not including, last_month."""
+        segment = self.get_segment(first_month)
+        if segment == self.get_segment(last_month - 1):
+            return (1 + self.interests[segment]) ** (last_month - first_month)
+        return self.get_growth_until(last_month) / self.get_growth_until(first_month)
+
+
+class PersonState:
+    """The state of a person that changes during a simulation."""
+    __slots__ = ('housing_money', 'bsu', 'bsu2', 'bsu_active', 'bsu2_active', 'bsu_left_to_fill', 'bsu2_left_to_fill',
+                 'maximum_bsu_left_to_fill_this_year')
+
+    def __init__(self, housing_money, bsu, bsu2, bsu_active, bsu2_active, bsu_left_to_fill, bsu2_left_to_fill,
+                 maximum_bsu_left_to_fill_this_year):
+        self.housing_money = housing_money
+        self.bsu = bsu
+        self.bsu2 = bsu2
+        self.bsu_active = bsu_active
+        self.bsu2_active = bsu2_active
+        self.bsu_left_to_fill = bsu_left_to_fill
+        self.bsu2_left_to_fill = bsu2_left_to_fill
+        self.maximum_bsu_left_to_fill_this_year = maximum_bsu_left_to_fill_this_year
+
+    @classmethod
+    def from_person(cls, person: Person, housing_money):
+        return cls(housing_money, person.bsu, person.bsu2, person.bsu_active, person.bsu2_active,
+                   person.bsu_left_to_fill, person.bsu2_left_to_fill, person.maximum_bsu_left_to_fill_this_year)
+
+    def copy(self):
+        return PersonState(self.housing_money, self.bsu, self.bsu2, self.bsu_active, self.bsu2_active,
+                           self.bsu_left_to_fill, self.bsu2_left_to_fill, self.maximum_bsu_left_to_fill_this_year)
+
+
 class SavingsSimulation:
-    def __init__(self, analysis_variables: AnalysisVariables, analysis_start_values: AnalysisStartValues):
+    __slots__ = ('property_value', 'mortgage', 'top_loan', 'rent', 'regular_savings', 'persons',
+                 'total_housing_money', 'bsu_interest', 'mortgage_interest', 'top_loan_interest', 'pop_bsu',
+                 'pop_bsu2', 'started_mortgage', 'starting_top_loan', 'cumulative_cost', 'bsu_interest_this_year',
+                 'bsu_interest_schedule')
+
+    def __init__(self, analysis_variables: AnalysisVariables, analysis_start_values: AnalysisStartValues,
+                 plan: SimulationPlan = None):
         self.property_value = analysis_variables.property_value
         self.mortgage = 0
         self.top_loan = 0
@@ -17,14 +104,52 @@ class SavingsSimulation:
         self.rent = analysis_start_values.rent
         self.regular_savings = analysis_start_values.deposit
 
-        self.persons = {person.name: copy.deepcopy(person) for person in analysis_start_values.persons}
-        for name, person in self.persons.items():
-            person.housing_money = analysis_variables.housing_money[name]
+        self.persons = {person.name: PersonState.from_person(person, analysis_variables.housing_money[person.name])
+                        for person in analysis_start_values.persons}
         self.total_housing_money = analysis_variables.total_housing_money
 
         self.bsu_interest = get_monthly_interest_from_yearly(analysis_start_values.bsu_interest_percentage)
         self.mortgage_interest = get_monthly_interest_from_yearly(analysis_variables.mortgage_interest_percentage)
         self.top_loan_interest = get_monthly_interest_from_yearly(analysis_variables.top_loan_interest_percentage)
+        # Only a changing BSU interest needs compounding over several rates, see new_bsu_year
+        scheduled_bsu_interest = plan.get_scheduled_values('bsu_interest_percentage') if plan else []
+        self.bsu_interest_schedule = RateSchedule(analysis_start_values.bsu_interest_percentage,
+                                                  scheduled_bsu_interest) if scheduled_bsu_interest else None
+
+        self.pop_bsu = analysis_variables.pop_bsu
+        self.pop_bsu2 = analysis_variables.pop_bsu2
+        self.started_mortgage = False
+        self.starting_top_loan = None
+        self.cumulative_cost = 0
+        self.bsu_interest_this_year = self.get_bsu_interest_for_several_months(
+            analysis_start_values.simulation_start_date.month)
+
+    def copy(self):
+        """An independent copy to fork the simulation from, only the person states need copying."""
+        simulation = SavingsSimulation.__new__(SavingsSimulation)
+        for attribute in SavingsSimulation.__slots__:
+            setattr(simulation, attribute, getattr(self, attribute))
+        simulation.persons = {name: person.copy() for name, person in self.persons.items()}
+        return simulation
+
+    def set_mortgage_terms(self, analysis_variables: AnalysisVariables):
+        """Replace everything that only matters once the mortgage starts."""
+        self.property_value = analysis_variables.property_value
+        self.mortgage_interest = get_monthly_interest_from_yearly(analysis_variables.mortgage_interest_percentage)
+        self.top_loan_interest = get_monthly_interest_from_yearly(analysis_variables.top_loan_interest_percentage)
+        self.total_housing_money = analysis_variables.total_housing_money
+        self.pop_bsu = analysis_variables.pop_bsu
+        self.pop_bsu2 = analysis_variables.pop_bsu2
+
+    def apply_schedule_changes(self, changes):
+        for change in changes:
+            if change.name == 'housing_money':
+                self.persons[change.person].housing_money = change.value
+                self.total_housing_money = sum(person.housing_money for person in self.persons.values())
+            elif change.name == 'rent':
+                self.rent = change.value
+            else:
+                setattr(self, INTEREST_ATTRIBUTES[change.name], get_monthly_interest_from_yearly(change.value))
 
     def get_total_bsu_value(self):
         return sum(person.bsu for person in self.persons.values()), sum(person.bsu2 for person in self.persons.values())
@@ -47,13 +172,14 @@ class SavingsSimulation:
             return self.rent, this_months_money
 
     def top_up_bsus(self, this_months_money):
-        for name, month_money in list(this_months_money.items()):
-            if self.persons[name].bsu_left_to_fill > 0 and self.persons[name].bsu_active:
-                this_months_money[name], self.persons[name].bsu, self.persons[name].bsu_left_to_fill = \
-                    self.do_bsu_fill(month_money, self.persons[name].bsu, self.persons[name].bsu_left_to_fill)
-            if self.persons[name].bsu2_left_to_fill > 0 and self.persons[name].bsu2_active:
-                this_months_money[name], self.persons[name].bsu2, self.persons[name].bsu2_left_to_fill = \
-                    self.do_bsu_fill(month_money, self.persons[name].bsu2, self.persons[name].bsu2_left_to_fill)
+        for name, person in self.persons.items():
+            month_money = this_months_money[name]
+            if person.bsu_left_to_fill > 0 and person.bsu_active:
+                this_months_money[name], person.bsu, person.bsu_left_to_fill = \
+                    self.do_bsu_fill(month_money, person.bsu, person.bsu_left_to_fill)
+            if person.bsu2_left_to_fill > 0 and person.bsu2_active:
+                this_months_money[name], person.bsu2, person.bsu2_left_to_fill = \
+                    self.do_bsu_fill(month_money, person.bsu2, person.bsu2_left_to_fill)
         return this_months_money
 
     @staticmethod
@@ -71,15 +197,15 @@ class SavingsSimulation:
     def empty_savings(self, pop_bsu, pop_bsu2):
         spendable_savings = self.regular_savings
         self.regular_savings = 0
-        for name in list(self.persons.keys()):
+        for person in self.persons.values():
             if pop_bsu:
-                spendable_savings += self.persons[name].bsu
-                self.persons[name].bsu = 0
-                self.persons[name].bsu_active = False
+                spendable_savings += person.bsu
+                person.bsu = 0
+                person.bsu_active = False
             if pop_bsu2:
-                spendable_savings += self.persons[name].bsu2
-                self.persons[name].bsu2 = 0
-                self.persons[name].bsu2_active = False
+                spendable_savings += person.bsu2
+                person.bsu2 = 0
+                person.bsu2_active = False
         return spendable_savings
 
     def start_mortgage(self, pop_bsu, pop_bsu2):
@@ -103,25 +229,32 @@ class SavingsSimulation:
         else:
             self.regular_savings += combined_money
 
-    def new_bsu_year(self):
+    def new_bsu_year(self, yearly_growth=None):
+        """Add the interest of the past year to the BSUs.
+
+        yearly_growth defaults to twelve months of the current rate.
+        """
+        if yearly_growth is None:
+            yearly_growth = (1 + self.bsu_interest) ** 12
         bsu_tax_rebate = {name: (person.maximum_bsu_left_to_fill_this_year - person.bsu_left_to_fill) * .2
                           for name, person in self.persons.items() if person.bsu > 0}
-        for name in list(self.persons.keys()):
-            if self.persons[name].bsu_active:
-                self.persons[name].bsu = self.persons[name].bsu * ((1 + self.bsu_interest) ** 12)
-                self.persons[name].bsu_left_to_fill = min(25000, max(300000 - self.persons[name].bsu, 0))
-                self.persons[name].maximum_bsu_left_to_fill_this_year = self.persons[name].bsu_left_to_fill
-            if self.persons[name].bsu2_active:
-                self.persons[name].bsu2 = self.persons[name].bsu2 * ((1 + self.bsu_interest) ** 12)
-                self.persons[name].bsu2_left_to_fill = min(25000, max(300000 - self.persons[name].bsu2, 0))
+        for person in self.persons.values():
+            if person.bsu_active:
+                person.bsu = person.bsu * yearly_growth
+                person.bsu_left_to_fill = min(25000, max(300000 - person.bsu, 0))
+                person.maximum_bsu_left_to_fill_this_year = person.bsu_left_to_fill
+            if person.bsu2_active:
+                person.bsu2 = person.bsu2 * yearly_growth
+                person.bsu2_left_to_fill = min(25000, max(300000 - person.bsu2, 0))
         return bsu_tax_rebate
 
     def kill_bsus(self, name):
-        extra_money = self.persons[name].bsu + self.persons[name].bsu2
-        self.persons[name].bsu = 0
-        self.persons[name].bsu2 = 0
-        self.persons[name].bsu_active = False
-        self.persons[name].bsu2_active = False
+        person = self.persons[name]
+        extra_money = person.bsu + person.bsu2
+        person.bsu = 0
+        person.bsu2 = 0
+        person.bsu_active = False
+        person.bsu2_active = False
         return extra_money
 
     def get_total_wealth(self, started_mortgage):
@@ -130,6 +263,132 @@ class SavingsSimulation:
             return savings
         return savings + self.property_value - self.mortgage - self.top_loan
 
+    def get_total_debt(self):
+        return self.mortgage + self.top_loan if self.started_mortgage else 0
+
+    def simulate_month(self, month, plan: SimulationPlan):
+        changes = plan.schedule_changes.get(month)
+        if changes:
+            self.apply_schedule_changes(changes)
+        this_months_money = {name: person.housing_money for name, person in self.persons.items()}
+        this_months_cost, this_months_money = self.get_month_cost(self.started_mortgage, this_months_money)
+        self.cumulative_cost = this_months_cost + self.cumulative_cost
+
+        if month in plan.new_year_months:
+            bsu_tax_rebate = self.new_bsu_year(None if self.bsu_interest_schedule is None else
+                                               self.bsu_interest_schedule.get_growth(month - 12, month))
+            self.cumulative_cost = self.cumulative_cost - self.bsu_interest_this_year - sum(bsu_tax_rebate.values())
+            self.bsu_interest_this_year = 0
+            for name, tax_rebate in bsu_tax_rebate.items():
+                this_months_money[name] += tax_rebate
+        else:
+            self.bsu_interest_this_year = self.get_bsu_interest_for_one_month(self.bsu_interest_this_year)
+
+        for name in plan.bsu_cutoffs.get(month, ()):
+            extra_money = self.kill_bsus(name)
+            this_months_money[name] += extra_money
+
+        # If saving, save up the money in the regular savings, otherwise pay down mortgage
+        if month < plan.mortgage_start_month:
+            this_months_money = self.top_up_bsus(this_months_money)
+            self.regular_savings += sum(this_months_money.values())
+        else:
+            if not self.started_mortgage:
+                self.start_mortgage(self.pop_bsu, self.pop_bsu2)
+                self.started_mortgage = True
+                self.starting_top_loan = self.top_loan
+            if not all([self.pop_bsu, self.pop_bsu2]):
+                this_months_money = self.top_up_bsus(this_months_money)
+            self.pay_down_debt(this_months_money)
+
+    def is_steady(self):
+        """True once the BSUs are gone and no top loan is left, so every month follows the same formula."""
+        return self.started_mortgage and self.top_loan == 0 and self.bsu_interest_this_year == 0 and not any(
+            person.bsu or person.bsu2 or person.bsu_active or person.bsu2_active for person in self.persons.values())
+
+    def fast_forward(self, result: SimulationResult, first_month, months):
+        """Jump ahead up to months months in a steady regime using closed form annuity and linear savings formulas.
+
+        Writes the skipped months into result starting at first_month and returns how many months were skipped,
+        which may be fewer than months (or none) since the month the mortgage is paid off is left to simulate_month.
+        """
+        if not self.is_steady() or months <= 0:
+            return 0
+        rows = slice(first_month, first_month + months)
+        housing_money = sum(person.housing_money for person in self.persons.values())
+        if self.mortgage == 0:
+            if housing_money < 0:
+                return 0
+            savings = self.regular_savings + np.arange(1, months + 1) * housing_money
+            self.regular_savings = savings[-1]
+            result.cumulative_cost[rows] = self.cumulative_cost
+            result.total_debt[rows] = 0
+            result.total_wealth[rows] = savings + self.property_value
+            result.top_loan[rows], result.bsu[rows], result.bsu2[rows] = 0, 0, 0
+            return months
+
+        # Each month the mortgage grows with the after tax interest, which is paid from the housing money
+        cost_rate = .78 * self.mortgage_interest
+        growth = cost_rate * housing_money / self.total_housing_money
+        if housing_money <= growth * self.mortgage:
+            return 0
+        # The first month in which the remaining mortgage is smaller than what is paid that month
+        if growth == 0:
+            paying_months = math.ceil(self.mortgage / housing_money - 1)
+        else:
+            # log1p and expm1 keep their precision for tiny rates, where 1 + growth rounds away most digits
+            steady_state = housing_money / growth
+            paying_months = math.ceil(math.log1p((self.mortgage - housing_money / (1 + growth))
+                                                 / (steady_state - self.mortgage)) / math.log1p(growth))
+        # Leave the last month before the mortgage is paid off to the stepwise path to avoid rounding differences
+        months = min(months, paying_months - 1)
+        if months <= 0:
+            return 0
+        rows = slice(first_month, first_month + months)
+        elapsed = np.arange(1, months + 1)
+        if growth == 0:
+            mortgages = self.mortgage - elapsed * housing_money
+            interest_paid = np.zeros(months)
+        else:
+            growth_factor = np.expm1(elapsed * math.log1p(growth))
+            mortgages = self.mortgage + (self.mortgage - steady_state) * growth_factor
+            interest_paid = cost_rate * ((self.mortgage - steady_state) * growth_factor / growth
+                                         + elapsed * steady_state)
+        result.cumulative_cost[rows] = self.cumulative_cost + interest_paid
+        result.total_debt[rows] = mortgages
+        result.total_wealth[rows] = self.regular_savings + self.property_value - mortgages
+        result.top_loan[rows], result.bsu[rows], result.bsu2[rows] = 0, 0, 0
+        self.mortgage, self.cumulative_cost = mortgages[-1], result.cumulative_cost[rows][-1]
+        return months
+
+    def write_month(self, result: SimulationResult, month):
+        result.cumulative_cost[month] = self.cumulative_cost
+        result.total_debt[month] = self.get_total_debt()
+        result.total_wealth[month] = self.get_total_wealth(self.started_mortgage)
+        result.top_loan[month] = self.top_loan
+        for i, person in enumerate(self.persons.values()):
+            result.bsu[month, i], result.bsu2[month, i] = person.bsu, person.bsu2
+
+    def simulate_months(self, plan: SimulationPlan, result: SimulationResult, first_month, last_month=None):
+        """Simulate the months of the plan from first_month up to last_month and write them into result."""
+        last_month = plan.number_of_months if last_month is None else last_month
+        month = first_month
+        # Fast forwarding assumes constant inputs, so it stops at the month a scheduled input changes
+        next_change_month = plan.get_next_change_month(month)
+        while month < last_month:
+            skipped = self.fast_forward(result, month, min(last_month, next_change_month) - month)
+            if skipped:
+                month += skipped
+                continue
+            self.simulate_month(month, plan)
+            self.write_month(result, month)
+            if self.started_mortgage and result.mortgage_start_month is None:
+                result.mortgage_start_month, result.starting_top_loan = month, self.starting_top_loan
+            month += 1
+            if month > next_change_month:
+                next_change_month = plan.get_next_change_month(month)
+        return result
+
 
 def date_range(start_date, months):
     if start_date.day > 28:
@@ -139,49 +398,146 @@ def date_range(start_date, months):
                             (start_date.month + n - 1) % 12 + 1, start_date.day)
 
 
-def calculate_cost(number_of_months, analysis_variables: AnalysisVariables, analysis_start_values: AnalysisStartValues):
-    saving_simulation = SavingsSimulation(analysis_variables, analysis_start_values)
-    cumulative_cost, total_debt, time = [0], [0], [analysis_start_values.simulation_start_date]
-    bsu_interest_this_year = saving_simulation.get_bsu_interest_for_several_months(time[0].month)
-    started_mortgage = False
-    total_wealth = [saving_simulation.get_total_wealth(started_mortgage)]
-
-    for pay_date in date_range(analysis_start_values.simulation_start_date, number_of_months):
-        time.append(pay_date)
-        this_months_money = {name: person.housing_money for name, person in saving_simulation.persons.items()}
-        this_months_cost, this_months_money = saving_simulation.get_month_cost(started_mortgage, this_months_money)
-        cumulative_cost.append(this_months_cost + cumulative_cost[-1])
-
-        if pay_date.month == 1:
-            bsu_tax_rebate = saving_simulation.new_bsu_year()
-            cumulative_cost[-1] = cumulative_cost[-1] - bsu_interest_this_year - sum(bsu_tax_rebate.values())
-            bsu_interest_this_year = 0
-            for name, tax_rebate in bsu_tax_rebate.items():
-                this_months_money[name] += tax_rebate
-        else:
-            bsu_interest_this_year = saving_simulation.get_bsu_interest_for_one_month(bsu_interest_this_year)
+def simulate_chunks(number_of_months, analysis_variables: AnalysisVariables,
+                    analysis_start_values: AnalysisStartValues, chunk_months=12):
+    """Run the simulation chunk_months months at a time, yielding the result of all months simulated so far.
+
+    Every yielded SimulationResult is a view on the same preallocated result, so stopping early only costs the
+    months that were simulated.
+    """
+    plan = SimulationPlan(analysis_start_values.simulation_start_date, number_of_months,
+                          analysis_start_values.persons, analysis_variables.mortgage_date,
+                          analysis_variables.schedule_changes)
+    saving_simulation = SavingsSimulation(analysis_variables, analysis_start_values, plan)
+    result = SimulationResult.allocate(analysis_start_values.simulation_start_date, number_of_months,
+                                       saving_simulation.persons.keys())
+    saving_simulation.write_month(result, 0)
+    simulated_months = 1
+    # The plan has at least one month, a horizon before the start must not make the chunks go backwards
+    chunk_months = max(chunk_months, 1)
+    while True:
+        last_month = min(simulated_months + chunk_months, plan.number_of_months)
+        saving_simulation.simulate_months(plan, result, simulated_months, last_month)
+        simulated_months = last_month
+        yield result[:simulated_months]
+        if simulated_months == plan.number_of_months:
+            return
+
+
+def iterate_months(number_of_months, analysis_variables: AnalysisVariables,
+                   analysis_start_values: AnalysisStartValues, stop_when=None, chunk_months=12):
+    """Yield a MonthState for every month, stopping after the first state for which stop_when(state) is true.
+
+    The bsu and bsu2 balances are tuples in the order of analysis_start_values.persons.
+    """
+    states = 0
+    for result in simulate_chunks(number_of_months, analysis_variables, analysis_start_values, chunk_months):
+        columns = [result.cumulative_cost[states:].tolist(), result.total_debt[states:].tolist(),
+                   result.total_wealth[states:].tolist(), result.top_loan[states:].tolist(),
+                   map(tuple, result.bsu[states:].tolist()), map(tuple, result.bsu2[states:].tolist())]
+        for month, date, *values in zip(range(states, len(result)), result.get_dates()[states:].tolist(), *columns):
+            state = MonthState(month, date, *values)
+            yield state
+            if stop_when is not None and stop_when(state):
+                return
+        states = len(result)
+
+
+def find_month(predicate, number_of_months, analysis_variables: AnalysisVariables,
+               analysis_start_values: AnalysisStartValues):
+    """The MonthState of the first month for which predicate(state) is true, None if it never is."""
+    return next((state for state in iterate_months(number_of_months, analysis_variables, analysis_start_values)
+                 if predicate(state)), None)
+
+
+def simulate(number_of_months, analysis_variables: AnalysisVariables, analysis_start_values: AnalysisStartValues):
+    for result in simulate_chunks(number_of_months, analysis_variables, analysis_start_values, number_of_months):
+        pass
+    return result
 
-        for name, person in saving_simulation.persons.items():
-            if pay_date - person.birth_date > datetime.timedelta(days=34*365):
-                extra_money = saving_simulation.kill_bsus(name)
-                this_months_money[name] += extra_money
 
-        # If saving, save up the money in the regular savings, otherwise pay down mortgage
-        if pay_date < analysis_variables.mortgage_date:
-            this_months_money = saving_simulation.top_up_bsus(this_months_money)
-            saving_simulation.regular_savings += sum(this_months_money.values())
-            total_debt.append(0)
+def calculate_cost(number_of_months, analysis_variables: AnalysisVariables, analysis_start_values: AnalysisStartValues):
+    return simulate(number_of_months, analysis_variables, analysis_start_values).to_lists()
+
+
+class SavingsPhase:
+    """The savings phase of a scenario, simulated once and forked for every mortgage that follows it.
+
+    Up to the month the mortgage starts the simulation only depends on the start values and the housing money, not
+    on the mortgage date, property value, interest rates or popped BSUs. The savings phase is simulated as far as
+    needed and snapshotted in the month a mortgage starts, so every scenario with the same housing money only
+    simulates its own mortgage phase.
+    """
+
+    def __init__(self, number_of_months, analysis_variables: AnalysisVariables,
+                 analysis_start_values: AnalysisStartValues):
+        self.start_date = analysis_start_values.simulation_start_date
+        self.housing_money = analysis_variables.housing_money
+        self.schedule_changes = analysis_variables.schedule_changes
+        self.plan = SimulationPlan(self.start_date, number_of_months, analysis_start_values.persons,
+                                   schedule_changes=self.schedule_changes)
+        self.simulation = SavingsSimulation(analysis_variables, analysis_start_values, self.plan)
+        self.result = SimulationResult.allocate(self.start_date, number_of_months, self.simulation.persons.keys())
+        self.simulation.write_month(self.result, 0)
+        self.simulated_months = 1
+        self.snapshots = {1: self.simulation.copy()}
+
+    def get_snapshot(self, month):
+        """The simulation just before month, with all earlier months of the savings phase simulated."""
+        month = max(month, 1)
+        if month in self.snapshots:
+            return self.snapshots[month]
+        if month >= self.simulated_months:
+            while self.simulated_months < month:
+                self.simulation.simulate_month(self.simulated_months, self.plan)
+                self.simulation.write_month(self.result, self.simulated_months)
+                self.simulated_months += 1
+            snapshot = self.simulation.copy()
         else:
-            if not started_mortgage:
-                saving_simulation.start_mortgage(analysis_variables.pop_bsu, analysis_variables.pop_bsu2)
-                started_mortgage = True
-                top_loan = saving_simulation.top_loan
-            if not all([analysis_variables.pop_bsu, analysis_variables.pop_bsu2]):
-                this_months_money = saving_simulation.top_up_bsus(this_months_money)
-            saving_simulation.pay_down_debt(this_months_money)
-            total_debt.append(saving_simulation.mortgage + saving_simulation.top_loan)
-        total_wealth.append(saving_simulation.get_total_wealth(started_mortgage))
-    return top_loan, time, cumulative_cost, total_debt, total_wealth
+            # Replay from the latest earlier snapshot, the savings phase is already past month
+            replay_month = max(snapshot_month for snapshot_month in self.snapshots if snapshot_month < month)
+            snapshot = self.snapshots[replay_month].copy()
+            for replayed_month in range(replay_month, month):
+                snapshot.simulate_month(replayed_month, self.plan)
+        self.snapshots[month] = snapshot
+        return snapshot
+
+    def simulate(self, analysis_variables: AnalysisVariables):
+        """The SimulationResult of analysis_variables, which must have the housing money and schedule of this savings
+        phase."""
+        if analysis_variables.housing_money != self.housing_money:
+            raise ValueError('The housing money differs from the housing money of the savings phase')
+        if analysis_variables.schedule_changes != self.schedule_changes:
+            raise ValueError('The schedule differs from the schedule of the savings phase')
+        plan = self.plan.with_mortgage_date(analysis_variables.mortgage_date)
+        fork_month = plan.mortgage_start_month
+        saving_simulation = self.get_snapshot(fork_month).copy()
+        saving_simulation.set_mortgage_terms(analysis_variables)
+        # The mortgage terms are the values at the start, catch up with the changes before the fork
+        for month in plan.schedule_change_months[:bisect.bisect_left(plan.schedule_change_months, fork_month)]:
+            saving_simulation.apply_schedule_changes(plan.schedule_changes[month])
+        result = SimulationResult.allocate(self.start_date, plan.number_of_months, saving_simulation.persons.keys())
+        for column in ['cumulative_cost', 'total_debt', 'total_wealth', 'top_loan', 'bsu', 'bsu2']:
+            getattr(result, column)[:fork_month] = getattr(self.result, column)[:fork_month]
+        return saving_simulation.simulate_months(plan, result, fork_month)
+
+
+def sweep_mortgage_dates(number_of_months, analysis_variables: AnalysisVariables,
+                         analysis_start_values: AnalysisStartValues, mortgage_dates):
+    """Simulate every mortgage date, sharing the savings phase between them.
+
+    Returns a SimulationResult for each date, in the order of mortgage_dates.
+    """
+    savings_phase = SavingsPhase(number_of_months, analysis_variables, analysis_start_values)
+    return [savings_phase.simulate(analysis_variables._replace(mortgage_date=mortgage_date))
+            for mortgage_date in mortgage_dates]
+
+
+for method_name, phase in [('__init__', 'simulation setup'), ('simulate_months', 'month loop'),
+                           ('get_month_cost', 'month cost'), ('top_up_bsus', 'BSU fill'),
+                           ('new_bsu_year', 'yearly rollover'), ('pay_down_debt', 'debt paydown'),
+                           ('fast_forward', 'fast forward')]:
+    mortgage_profiling.instrument(SavingsSimulation, method_name, phase)
 
 
 def main():
@@ -1,11 +1,21 @@
 import sys
 import datetime
+import concurrent.futures
+import functools
+import types
 
-from PySide2 import QtWidgets
+from PySide2 import QtCore, QtWidgets
+from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT
 
+from astrid_roald_mortgage_gui import mortgage_profiling
 from astrid_roald_mortgage_gui.mortgage_objects import AnalysisVariables, AnalysisStartValues, Person
-from astrid_roald_mortgage_gui.mortgage_functions import calculate_cost
-from astrid_roald_mortgage_gui.secrets.astrid_roald_input import astrid_roald_input
+from astrid_roald_mortgage_gui.mortgage_functions import simulate
+from astrid_roald_mortgage_gui.mortgage_cache import CostCache
+from astrid_roald_mortgage_gui.mortgage_monte_carlo import MeanRevertingRates, calculate_percentile_bands
+from astrid_roald_mortgage_gui.mortgage_heatmap import HEATMAP_INPUTS, METRICS, HeatmapCache, get_default_range, \
+    refine_heatmap
+from astrid_roald_mortgage_gui.mortgage_solver import METRICS as SOLVER_METRICS, SOLVER_INPUTS, solve
+from astrid_roald_mortgage_gui.mortgage_store import DEFAULT_STORE_DIRECTORY, ResultStore
 from astrid_roald_mortgage_gui.matplotlib_widget import MyMplCanvas
 
 
@@ -46,16 +56,128 @@ class AnalysisVariableWidgets:
                                  float(self.mortgage_interest_percentage_widget.text()),
                                  {name: float(widget.text()) for name, widget in self.housing_money_widgets.items()})
 
+    def set_analysis_variables(self, analysis_variables: AnalysisVariables):
+        self.pop_bsu_widget.setChecked(analysis_variables.pop_bsu)
+        self.pop_bsu2_widget.setChecked(analysis_variables.pop_bsu2)
+        self.mortgage_date_widget.setDate(analysis_variables.mortgage_date)
+        for name, widget in self.housing_money_widgets.items():
+            widget.setText(str(analysis_variables.housing_money[name]))
+        for field in ['property_value', 'top_loan_interest_percentage', 'mortgage_interest_percentage']:
+            getattr(self, f'{field}_widget').setText(str(getattr(analysis_variables, field)))
+
+
+def calculate_rate_risk(number_of_months, analysis_variables: AnalysisVariables,
+                        analysis_start_values: AnalysisStartValues):
+    rate_model = MeanRevertingRates(analysis_variables.mortgage_interest_percentage)
+    return calculate_percentile_bands(number_of_months, analysis_variables, analysis_start_values, rate_model)
+
+
+def solve_or_explain(number_of_months, analysis_variables: AnalysisVariables,
+                     analysis_start_values: AnalysisStartValues, **options):
+    # A target that cannot be reached is an answer to show, not an error of the worker thread
+    try:
+        return solve(number_of_months, analysis_variables, analysis_start_values, **options)
+    except ValueError as e:
+        return e
+
+
+class CostCalculator(QtCore.QObject):
+    """Runs a simulation on a worker thread where only the latest request is delivered."""
+    result_ready = QtCore.Signal(int, object, object)
+    calculation_failed = QtCore.Signal(int, object)
+
+    def __init__(self, calculate=simulate, parent=None):
+        super(CostCalculator, self).__init__(parent)
+        self.calculate = calculate
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.pending = None
+        self.latest_request = 0
+
+    def cancel(self):
+        """Drop the pending request, results of a request that is still running are no longer delivered."""
+        self.latest_request += 1
+        if self.pending is not None:
+            self.pending.cancel()
+
+    def submit(self, number_of_months, analysis_variables: AnalysisVariables,
+               analysis_start_values: AnalysisStartValues, **options):
+        self.cancel()
+        self.pending = self.executor.submit(self.run, self.latest_request, number_of_months, analysis_variables,
+                                            analysis_start_values, **options)
+
+    def run(self, request, number_of_months, analysis_variables, analysis_start_values, **options):
+        # Runs on the worker thread, the signal is queued to the receiver in the main thread. A generator delivers
+        # every partial result and is abandoned as soon as a newer request comes in. Nobody waits for the future,
+        # so errors are delivered as a signal instead of being kept in it.
+        try:
+            result = self.calculate(number_of_months, analysis_variables, analysis_start_values, **options)
+            for partial_result in result if isinstance(result, types.GeneratorType) else [result]:
+                if request != self.latest_request:
+                    return
+                self.result_ready.emit(request, analysis_variables, partial_result)
+        except Exception as e:
+            if request == self.latest_request:
+                self.calculation_failed.emit(request, e)
+
+    def shutdown(self):
+        if self.pending is not None:
+            self.pending.cancel()
+        self.executor.shutdown(wait=False)
+
+
+def get_legend_label(analysis_variables: AnalysisVariables, top_loan):
+    bsu_legend = ', BSU\'s popped:' if any([analysis_variables.pop_bsu, analysis_variables.pop_bsu2]) else ''
+    bsu_legend += ' BSU' if analysis_variables.pop_bsu else ''
+    bsu_legend += ' BSU2' if analysis_variables.pop_bsu2 else ''
+    return f"d: {analysis_variables.mortgage_date.strftime('%d/%m/%Y')}, " \
+        f"h: {analysis_variables.total_housing_money}, " \
+        f"g: {analysis_variables.property_value}, " \
+        f"t%: {analysis_variables.top_loan_interest_percentage}, " \
+        f"m%: {analysis_variables.mortgage_interest_percentage}" \
+        f"{bsu_legend}, " \
+        f"Toploan: {top_loan}"
+
 
 class MortgagePlotter(QtWidgets.QDialog):
-    def __init__(self, analysis_start_values: AnalysisStartValues, parent=None):
+    def __init__(self, analysis_start_values: AnalysisStartValues, parent=None,
+                 store_directory=DEFAULT_STORE_DIRECTORY):
         super(MortgagePlotter, self).__init__(parent)
         # Set start and ending date for calculation
         self.analysis_start_values = analysis_start_values
         self.starting_date = self.analysis_start_values.simulation_start_date
         self.ending_date = QtWidgets.QDateEdit()
         self.ending_date.setDate(self.starting_date + datetime.timedelta(days=360*12.5))
-        self.ending_date.dateChanged.connect(self.change_current_cost_line)
+        self.ending_date.dateChanged.connect(self.schedule_cost_calculation)
+
+        # Recalculate in the background once the input has been stable for a moment
+        self.cost_cache = CostCache()
+        self.cost_calculator = CostCalculator(functools.partial(self.cost_cache.simulate_chunks, chunk_months=60),
+                                              self)
+        self.cost_calculator.result_ready.connect(self.change_current_cost_line)
+        self.cost_calculator.calculation_failed.connect(self.show_calculation_error)
+        self.debounce_timer = QtCore.QTimer(self)
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.setInterval(150)
+        self.debounce_timer.timeout.connect(self.start_cost_calculation)
+        self.risk_calculator = CostCalculator(calculate_rate_risk, self)
+        self.risk_calculator.result_ready.connect(self.show_rate_risk)
+        self.risk_calculator.calculation_failed.connect(self.show_calculation_error)
+        self.heatmap_cache = HeatmapCache()
+        self.heatmap_calculator = CostCalculator(functools.partial(refine_heatmap, cache=self.heatmap_cache), self)
+        self.heatmap_calculator.result_ready.connect(self.show_heatmap)
+        self.heatmap_calculator.calculation_failed.connect(self.show_calculation_error)
+        self.heatmap_timer = QtCore.QTimer(self)
+        self.heatmap_timer.setSingleShot(True)
+        self.heatmap_timer.setInterval(300)
+        self.heatmap_timer.timeout.connect(self.start_heatmap_calculation)
+        self.heatmap_ranges = None
+        self.drawing_heatmap = False
+        self.solver = CostCalculator(solve_or_explain, self)
+        self.solver.result_ready.connect(self.show_solution)
+        self.solver.calculation_failed.connect(lambda request, error: self.solve_label.setText(
+            f'Solving failed: {error!r}'))
+        # Saved cost calculations are kept on disk between sessions
+        self.result_store = ResultStore(store_directory)
 
         # Create layout
         layout = QtWidgets.QVBoxLayout()
@@ -64,8 +186,14 @@ class MortgagePlotter(QtWidgets.QDialog):
         top_layout = QtWidgets.QHBoxLayout()
         layout.addLayout(top_layout)
 
+        canvas_layout = QtWidgets.QHBoxLayout()
+        layout.addLayout(canvas_layout)
+
         graphs_layout = QtWidgets.QVBoxLayout()
-        layout.addLayout(graphs_layout)
+        canvas_layout.addLayout(graphs_layout)
+
+        heatmap_layout = QtWidgets.QVBoxLayout()
+        canvas_layout.addLayout(heatmap_layout)
 
         static_info_layout = QtWidgets.QVBoxLayout()
         top_layout.addLayout(static_info_layout)
@@ -77,15 +205,52 @@ class MortgagePlotter(QtWidgets.QDialog):
 
         # Create widgets and add then to layout
         self.analysis_variable_widgets = AnalysisVariableWidgets(analysis_start_values,
-                                                                 self.change_current_cost_line, input_data_layout)
+                                                                 self.schedule_cost_calculation, input_data_layout)
         self.button = QtWidgets.QPushButton("Save current cost calculation")
-        self.button.clicked.connect(self.add_cost_line)
-
-        self.cost_canvas, self.debt_canvas, self.wealth_canvas = MyMplCanvas(), MyMplCanvas(), MyMplCanvas()
+        self.button.clicked.connect(self.save_cost_line)
+        self.clear_button = QtWidgets.QPushButton("Clear saved cost calculations")
+        self.clear_button.clicked.connect(self.clear_saved_cost_lines)
+        self.risk_button = QtWidgets.QPushButton("Show interest rate risk (P5-P95)")
+        self.risk_button.clicked.connect(self.start_risk_calculation)
+
+        # Goal seek one input for a target value of a metric
+        self.solve_input_widget, self.solve_metric_widget = QtWidgets.QComboBox(), QtWidgets.QComboBox()
+        self.solve_input_widget.addItems(list(SOLVER_INPUTS))
+        self.solve_metric_widget.addItems(list(SOLVER_METRICS))
+        self.solve_target_widget = QtWidgets.QLineEdit('0')
+        self.solve_button = QtWidgets.QPushButton('Solve for')
+        self.solve_button.clicked.connect(self.start_solve)
+        self.solve_label = QtWidgets.QLabel()
+        solve_layout = QtWidgets.QFormLayout()
+        solve_layout.addRow(self.solve_button, self.solve_input_widget)
+        solve_layout.addRow('such that', self.solve_metric_widget)
+        solve_layout.addRow('is at most', self.solve_target_widget)
+        solve_layout.addRow(self.solve_label)
+
+        self.cost_canvas, self.debt_canvas, self.wealth_canvas = [MyMplCanvas(interactive=True) for _ in range(3)]
         self.canvases = [self.cost_canvas, self.debt_canvas, self.wealth_canvas]
         for canvas in self.canvases:
             graphs_layout.addWidget(canvas)
 
+        # Sensitivity of the final cost or wealth to two inputs, pan and zoom with the toolbar
+        heatmap_options_layout = QtWidgets.QFormLayout()
+        heatmap_layout.addLayout(heatmap_options_layout)
+        self.heatmap_x_widget, self.heatmap_y_widget, self.heatmap_metric_widget = [QtWidgets.QComboBox()
+                                                                                    for _ in range(3)]
+        self.heatmap_x_widget.addItems(list(HEATMAP_INPUTS))
+        self.heatmap_y_widget.addItems(list(HEATMAP_INPUTS))
+        self.heatmap_y_widget.setCurrentIndex(3)
+        self.heatmap_metric_widget.addItems(METRICS)
+        for label, widget in [('heatmap x', self.heatmap_x_widget), ('heatmap y', self.heatmap_y_widget),
+                              ('heatmap value', self.heatmap_metric_widget)]:
+            widget.currentIndexChanged.connect(self.reset_heatmap_view)
+            heatmap_options_layout.addRow(label, widget)
+        self.heatmap_canvas = MyMplCanvas(width=4)
+        self.heatmap_canvas.axes.callbacks.connect('xlim_changed', self.heatmap_view_changed)
+        self.heatmap_canvas.axes.callbacks.connect('ylim_changed', self.heatmap_view_changed)
+        heatmap_layout.addWidget(NavigationToolbar2QT(self.heatmap_canvas, self))
+        heatmap_layout.addWidget(self.heatmap_canvas)
+
         # Add static info
         bsu_total = sum(person.bsu + person.bsu2 for person in analysis_start_values.persons)
         info_labels = [f'The starting date for the input data is {self.analysis_start_values.simulation_start_date}',
@@ -93,63 +258,207 @@ class MortgagePlotter(QtWidgets.QDialog):
                        f'The value for deposit at the starting date is {analysis_start_values.deposit} NOK',
                        f'The total bsu value at the starting date is {bsu_total} NOK']
         [static_info_layout.addWidget(QtWidgets.QLabel(info_label)) for info_label in info_labels]
+        self.profile_label = QtWidgets.QLabel()
+        self.profile_label.setVisible(mortgage_profiling.enabled)
+        static_info_layout.addWidget(self.profile_label)
+        self.error_label = QtWidgets.QLabel()
+        self.error_label.setStyleSheet('color: red')
+        static_info_layout.addWidget(self.error_label)
         static_info_layout.addLayout(input_data_layout)
 
         for i, widget in enumerate([self.ending_date, self.analysis_variable_widgets.pop_bsu_widget,
-                                    self.analysis_variable_widgets.pop_bsu2_widget, self.button]):
+                                    self.analysis_variable_widgets.pop_bsu2_widget, self.button,
+                                    self.clear_button, self.risk_button]):
             options_layout.addWidget(widget, i, 0)
+        options_layout.addLayout(solve_layout, 0, 1, 6, 1)
 
-        # Do first simulation
-        self.cur_lines = [None, None, None]
+        # Show the calculations saved in earlier sessions, then do first simulation
+        self.show_saved_cost_lines()
         self.add_cost_line()
+        self.reset_heatmap_view()
 
-    def set_legend_labels(self, top_loan):
-        analysis_variables = self.analysis_variable_widgets.get_analysis_variables()
-        bsu_legend = ', BSU\'s popped:' if any([analysis_variables.pop_bsu, analysis_variables.pop_bsu2]) else ''
-        bsu_legend += ' BSU' if analysis_variables.pop_bsu else ''
-        bsu_legend += ' BSU2' if analysis_variables.pop_bsu2 else ''
-        label = f"d: {analysis_variables.mortgage_date.strftime('%d/%m/%Y')}, " \
-            f"h: {analysis_variables.total_housing_money}, " \
-            f"g: {analysis_variables.property_value}, " \
-            f"t%: {analysis_variables.top_loan_interest_percentage}, " \
-            f"m%: {analysis_variables.mortgage_interest_percentage}" \
-            f"{bsu_legend}, " \
-            f"Toploan: {top_loan}"
-        self.cur_lines[0].set_label(label)
-        self.cur_lines[1].set_label(label)
-        self.cost_canvas.axes.legend()
-        self.debt_canvas.axes.legend()
+    def set_legend_labels(self, analysis_variables: AnalysisVariables, top_loan):
+        label = get_legend_label(analysis_variables, top_loan)
+        self.cost_canvas.set_current_label(label)
+        self.debt_canvas.set_current_label(label)
 
     def redraw_canvasses(self):
         for canvas in self.canvases:
-            canvas.axes.relim()
-            canvas.axes.autoscale_view()
-            canvas.draw()
+            canvas.redraw()
+
+    def show_saved_cost_lines(self):
+        for key, label, analysis_variables in self.result_store.get_saved(self.analysis_start_values):
+            result = self.result_store.load(key)
+            if result is None:
+                continue
+            time = result.get_dates()
+            for canvas, metric in zip(self.canvases, [result.cumulative_cost, result.total_debt,
+                                                      result.total_wealth]):
+                canvas.axes.plot(time, metric, label=label)
+
+    def save_cost_line(self):
+        try:
+            analysis_variables = self.analysis_variable_widgets.get_analysis_variables()
+        except ValueError:
+            return
+        number_of_months = self.get_number_of_months()
+        result = self.cost_cache.simulate(number_of_months, analysis_variables, self.analysis_start_values)
+        self.result_store.save(number_of_months, analysis_variables, self.analysis_start_values, result,
+                               get_legend_label(analysis_variables, result.starting_top_loan), saved=True)
+        self.add_cost_line()
+
+    def clear_saved_cost_lines(self):
+        self.result_store.remove_saved(self.analysis_start_values)
+        for canvas in self.canvases:
+            canvas.clear_saved_lines()
 
     def add_cost_line(self):
-        top_loan, time, cost_list, total_debt, total_wealth = self.get_cost()
-        for i, (canvas, metric) in enumerate(zip(self.canvases, [cost_list, total_debt, total_wealth])):
+        try:
+            analysis_variables = self.analysis_variable_widgets.get_analysis_variables()
+        except ValueError:
+            return
+        result = self.cost_cache.simulate(self.get_number_of_months(), analysis_variables,
+                                          self.analysis_start_values)
+        time = result.get_dates()
+        for canvas, metric in zip(self.canvases, [result.cumulative_cost, result.total_debt, result.total_wealth]):
             canvas.axes.plot(time, metric)
-            self.cur_lines[i] = canvas.axes.lines[-1]
-        self.set_legend_labels(top_loan)
+            canvas.set_current_line(canvas.axes.lines[-1], show_legend=canvas is not self.wealth_canvas)
+        self.set_legend_labels(analysis_variables, result.starting_top_loan)
         self.redraw_canvasses()
 
-    def change_current_cost_line(self):
-        top_loan, time, cost_list, total_debt, total_wealth = self.get_cost()
-        for i, metric in enumerate([cost_list, total_debt, total_wealth]):
-            self.cur_lines[i].set_xdata(time)
-            self.cur_lines[i].set_ydata(metric)
-        print(cost_list[-1], '\n')
-        self.set_legend_labels(top_loan)
-        self.redraw_canvasses()
-
-    def get_cost(self):
-        number_of_months = round((self.ending_date.date().toPython() - self.starting_date).days / 365 * 12)
-        return calculate_cost(number_of_months, self.analysis_variable_widgets.get_analysis_variables(),
-                              self.analysis_start_values)
+    def schedule_cost_calculation(self):
+        self.debounce_timer.start()
+        self.heatmap_timer.start()
+
+    def start_cost_calculation(self):
+        try:
+            analysis_variables = self.analysis_variable_widgets.get_analysis_variables()
+        except ValueError:
+            # Intermediate input such as an empty field, wait for the next edit
+            return
+        self.cost_calculator.submit(self.get_number_of_months(), analysis_variables, self.analysis_start_values)
+
+    def change_current_cost_line(self, request, analysis_variables, result):
+        if request != self.cost_calculator.latest_request:
+            return
+        self.error_label.clear()
+        time = result.get_dates()
+        for canvas, metric in zip(self.canvases, [result.cumulative_cost, result.total_debt, result.total_wealth]):
+            canvas.current_line.set_xdata(time)
+            canvas.current_line.set_ydata(metric)
+        self.set_legend_labels(analysis_variables, result.starting_top_loan)
+        for canvas in self.canvases:
+            canvas.redraw_current_line()
+        if mortgage_profiling.enabled:
+            self.profile_label.setText(mortgage_profiling.stats.status_line(PROFILE_STATUS_PHASES))
+
+    def show_calculation_error(self, request, error):
+        # The plots keep showing the last result that could be calculated
+        self.error_label.setText(f'Calculation failed: {error!r}')
+
+    def start_risk_calculation(self):
+        try:
+            analysis_variables = self.analysis_variable_widgets.get_analysis_variables()
+        except ValueError:
+            return
+        self.risk_calculator.submit(self.get_number_of_months(), analysis_variables, self.analysis_start_values)
+
+    def show_rate_risk(self, request, analysis_variables, bands):
+        if request != self.risk_calculator.latest_request:
+            return
+        for canvas, metric in zip(self.canvases, [bands.cumulative_cost, bands.total_debt, bands.total_wealth]):
+            canvas.set_band(bands.time, metric[0], metric[-1])
+            canvas.redraw()
+
+    def start_solve(self):
+        try:
+            analysis_variables = self.analysis_variable_widgets.get_analysis_variables()
+            target = float(self.solve_target_widget.text())
+        except ValueError:
+            return
+        self.solve_label.setText('Solving...')
+        self.solver.submit(self.get_number_of_months(), analysis_variables, self.analysis_start_values,
+                           input_name=self.solve_input_widget.currentText(),
+                           metric=self.solve_metric_widget.currentText(), target=target)
+
+    def show_solution(self, request, analysis_variables, solution):
+        if request != self.solver.latest_request:
+            return
+        if isinstance(solution, ValueError):
+            self.solve_label.setText(str(solution))
+            return
+        self.solve_label.setText(f'{self.solve_input_widget.currentText()}: {solution.value:g} gives '
+                                 f'{self.solve_metric_widget.currentText()} {solution.metric_value:.0f} '
+                                 f'({solution.simulations} simulations)')
+        self.analysis_variable_widgets.set_analysis_variables(solution.analysis_variables)
+
+    def reset_heatmap_view(self):
+        self.heatmap_ranges = None
+        self.heatmap_timer.start()
+
+    def heatmap_view_changed(self, axes):
+        ranges = axes.get_xlim(), axes.get_ylim()
+        # Only a pan or zoom by the user asks for a new heatmap, not the limits set while drawing it
+        if not self.drawing_heatmap and self.heatmap_ranges is not None and ranges != self.heatmap_ranges:
+            self.heatmap_ranges = ranges
+            self.heatmap_timer.start()
+
+    def start_heatmap_calculation(self):
+        try:
+            analysis_variables = self.analysis_variable_widgets.get_analysis_variables()
+        except ValueError:
+            return
+        x_input, y_input = self.heatmap_x_widget.currentText(), self.heatmap_y_widget.currentText()
+        if x_input == y_input:
+            self.heatmap_calculator.cancel()
+            self.heatmap_canvas.axes.set_title('Choose two different inputs')
+            self.heatmap_canvas.draw_idle()
+            return
+        if self.heatmap_ranges is None:
+            self.heatmap_ranges = (get_default_range(x_input, analysis_variables, self.analysis_start_values),
+                                   get_default_range(y_input, analysis_variables, self.analysis_start_values))
+        self.heatmap_calculator.submit(self.get_number_of_months(), analysis_variables, self.analysis_start_values,
+                                       x_input=x_input, x_range=self.heatmap_ranges[0], y_input=y_input,
+                                       y_range=self.heatmap_ranges[1],
+                                       metric=self.heatmap_metric_widget.currentText())
+
+    def show_heatmap(self, request, analysis_variables, frame):
+        if request != self.heatmap_calculator.latest_request or self.heatmap_ranges is None:
+            return
+        canvas = self.heatmap_canvas
+        self.drawing_heatmap = True
+        try:
+            canvas.set_image(frame.x_values, frame.y_values, frame.values, *self.heatmap_ranges)
+        finally:
+            self.drawing_heatmap = False
+        canvas.axes.set_xlabel(self.heatmap_x_widget.currentText())
+        canvas.axes.set_ylabel(self.heatmap_y_widget.currentText())
+        canvas.axes.set_title(self.heatmap_metric_widget.currentText() + ('' if frame.complete else ' (refining)'))
+
+    def get_number_of_months(self):
+        return round((self.ending_date.date().toPython() - self.starting_date).days / 365 * 12)
+
+    def closeEvent(self, event):
+        self.debounce_timer.stop()
+        self.cost_calculator.shutdown()
+        self.heatmap_timer.stop()
+        self.risk_calculator.shutdown()
+        self.heatmap_calculator.shutdown()
+        self.solver.shutdown()
+        self.result_store.close()
+        super(MortgagePlotter, self).closeEvent(event)
+
+
+PROFILE_STATUS_PHASES = ['parse inputs', 'simulation setup', 'month loop', 'legend', 'current line redraw',
+                         'canvas draw']
+mortgage_profiling.instrument(AnalysisVariableWidgets, 'get_analysis_variables', 'parse inputs')
+mortgage_profiling.instrument(MortgagePlotter, 'set_legend_labels', 'legend')
+mortgage_profiling.instrument(MyMplCanvas, 'redraw_current_line', 'current line redraw')
+mortgage_profiling.instrument(MyMplCanvas, 'draw', 'canvas draw')
 
 
 def run_app():
+    from astrid_roald_mortgage_gui.secrets.astrid_roald_input import astrid_roald_input
     app = QtWidgets.QApplication.instance() if QtWidgets.QApplication.instance() else QtWidgets.QApplication([])
 
     # example_input = AnalysisStartValues([Person(datetime.date(1990, 1, 1), 'p1', 10000, 100000, 50000, 25000, 25000),
@@ -0,0 +1,169 @@
+import collections
+import math
+
+import numpy as np
+
+from astrid_roald_mortgage_gui.mortgage_objects import AnalysisStartValues, AnalysisVariables
+from astrid_roald_mortgage_gui.mortgage_batch import calculate_cost_batch
+from astrid_roald_mortgage_gui.mortgage_cache import get_scenario_key
+from astrid_roald_mortgage_gui.mortgage_plan import SimulationPlan
+
+HeatmapFrame = collections.namedtuple('HeatmapFrame', ['x_values', 'y_values', 'values', 'complete'])
+METRICS = ['final cost', 'final wealth']
+
+
+def set_property_value(analysis_variables, analysis_start_values, value):
+    return analysis_variables._replace(property_value=value)
+
+
+def set_mortgage_date(analysis_variables, analysis_start_values, value):
+    plan = SimulationPlan(analysis_start_values.simulation_start_date, int(value) + 1, [])
+    return analysis_variables._replace(mortgage_date=plan.get_date(int(value)))
+
+
+def set_top_loan_interest_percentage(analysis_variables, analysis_start_values, value):
+    return analysis_variables._replace(top_loan_interest_percentage=value)
+
+
+def set_mortgage_interest_percentage(analysis_variables, analysis_start_values, value):
+    return analysis_variables._replace(mortgage_interest_percentage=value)
+
+
+def set_total_housing_money(analysis_variables, analysis_start_values, value):
+    # Every person keeps their share of the total, or gets an equal share when there is nothing to divide
+    housing_money = analysis_variables.housing_money
+    if analysis_variables.total_housing_money:
+        share = value / analysis_variables.total_housing_money
+        housing_money = {name: money * share for name, money in housing_money.items()}
+    else:
+        housing_money = {name: value / len(housing_money) for name in housing_money}
+    return analysis_variables._replace(total_housing_money=value, housing_money=housing_money)
+
+
+def get_mortgage_month(analysis_variables, analysis_start_values):
+    start_date = analysis_start_values.simulation_start_date
+    mortgage_date = analysis_variables.mortgage_date
+    return (mortgage_date.year - start_date.year) * 12 + mortgage_date.month - start_date.month
+
+
+# For every input: how to derive variables with another value for it, how to read it and the unit its lattice is
+# built on
+HEATMAP_INPUTS = collections.OrderedDict([
+    ('property value', (set_property_value, lambda variables, start_values: variables.property_value, 10000)),
+    ('mortgage date (months from start)', (set_mortgage_date, get_mortgage_month, 1)),
+    ('top loan interest percentage', (set_top_loan_interest_percentage,
+                                      lambda variables, start_values: variables.top_loan_interest_percentage, .01)),
+    ('mortgage interest percentage', (set_mortgage_interest_percentage,
+                                      lambda variables, start_values: variables.mortgage_interest_percentage, .01)),
+    ('total housing money', (set_total_housing_money,
+                             lambda variables, start_values: variables.total_housing_money, 100)),
+])
+
+
+def get_default_range(input_name, analysis_variables: AnalysisVariables, analysis_start_values: AnalysisStartValues):
+    value = HEATMAP_INPUTS[input_name][1](analysis_variables, analysis_start_values)
+    if input_name.startswith('mortgage date'):
+        return 1, max(value * 2, 60)
+    if input_name.endswith('percentage'):
+        return max(value - 2, 0), value + 2
+    return value / 2, value * 1.5
+
+
+def get_lattice(low, high, unit, points):
+    """Multiples of a power of two times unit covering [low, high] with at most about points values.
+
+    Coarser lattices are subsets of finer ones and the lattice does not move when the range is panned, so points
+    computed for one view are reused by every other view. A range narrower than one unit gets the lattice point
+    nearest to its middle.
+    """
+    exponent = max(0, math.ceil(math.log2(max(high - low, unit) / unit / max(points - 1, 1))))
+    step = 2 ** exponent
+    indices = np.arange(math.ceil(low / unit / step), math.floor(high / unit / step) + 1) * step
+    if not len(indices):
+        indices = np.array([round((low + high) / 2 / unit / step) * step])
+    return indices, exponent
+
+
+class HeatmapCache:
+    """Final cost and wealth of already simulated grid points, per fixed scenario and pair of inputs."""
+
+    def __init__(self, max_contexts=8):
+        self.max_contexts = max_contexts
+        self.contexts = collections.OrderedDict()
+
+    def get_points(self, context):
+        points = self.contexts.setdefault(context, {})
+        self.contexts.move_to_end(context)
+        while len(self.contexts) > self.max_contexts:
+            self.contexts.popitem(last=False)
+        return points
+
+
+def refine_heatmap(number_of_months, analysis_variables: AnalysisVariables,
+                   analysis_start_values: AnalysisStartValues, x_input, x_range, y_input, y_range,
+                   metric='final cost', cache=None, resolution=64, coarse_resolution=8, tile_size=256):
+    """Yield HeatmapFrames of the metric over x_range and y_range, from a coarse grid to the full resolution.
+
+    Each refinement level doubles the resolution. Its missing points are simulated in tiles of tile_size scenarios
+    with the batch engine and a frame is yielded after every tile. Points that are not computed yet show the value
+    of the nearest point of the previous level. Computed points are kept in cache and reused by later calls.
+    """
+    if x_input == y_input:
+        raise ValueError(f'The heatmap needs two different inputs, got {x_input!r} twice')
+    cache = cache if cache is not None else HeatmapCache()
+    set_x, _, x_unit = HEATMAP_INPUTS[x_input]
+    set_y, _, y_unit = HEATMAP_INPUTS[y_input]
+    # Every point sets both axes itself, so the current values of the axes are left out of the key. Editing an
+    # input that is on an axis then reuses the computed points. Housing money is rounded since rescaled shares can
+    # differ in the last digit from the same shares scaled directly.
+    context_variables = set_y(set_x(analysis_variables, analysis_start_values, x_unit), analysis_start_values,
+                              y_unit)
+    context_variables = context_variables._replace(housing_money={
+        name: round(money, 9) for name, money in context_variables.housing_money.items()})
+    points = cache.get_points((get_scenario_key(context_variables, analysis_start_values), number_of_months,
+                               x_input, y_input))
+    metric_index = METRICS.index(metric)
+
+    previous = None
+    level_resolution = coarse_resolution
+    while True:
+        x_indices, _ = get_lattice(*x_range, x_unit, level_resolution)
+        y_indices, _ = get_lattice(*y_range, y_unit, level_resolution)
+        values = np.full((len(y_indices), len(x_indices)), np.nan)
+        if previous is not None:
+            # Start from the nearest value of the coarser level
+            previous_x, previous_y, previous_values = previous
+            nearest_x = np.abs(x_indices[:, None] - previous_x[None, :]).argmin(axis=1)
+            nearest_y = np.abs(y_indices[:, None] - previous_y[None, :]).argmin(axis=1)
+            values = previous_values[nearest_y][:, nearest_x].copy()
+
+        missing = []
+        for row, y_index in enumerate(y_indices):
+            for column, x_index in enumerate(x_indices):
+                point = points.get((x_index, y_index))
+                if point is None:
+                    missing.append((row, column, x_index, y_index))
+                else:
+                    values[row, column] = point[metric_index]
+
+        for first in range(0, len(missing), tile_size):
+            tile = missing[first:first + tile_size]
+            tile_variables = []
+            for row, column, x_index, y_index in tile:
+                variables = set_x(analysis_variables, analysis_start_values, x_index * x_unit)
+                tile_variables.append(set_y(variables, analysis_start_values, y_index * y_unit))
+            _, _, cumulative_cost, _, total_wealth = calculate_cost_batch(number_of_months, tile_variables,
+                                                                          analysis_start_values)
+            for (row, column, x_index, y_index), cost, wealth in zip(tile, cumulative_cost[:, -1],
+                                                                     total_wealth[:, -1]):
+                points[(x_index, y_index)] = (cost, wealth)
+                values[row, column] = (cost, wealth)[metric_index]
+            yield HeatmapFrame(x_indices * x_unit, y_indices * y_unit, values, False)
+
+        complete = level_resolution >= resolution
+        if complete or not missing:
+            yield HeatmapFrame(x_indices * x_unit, y_indices * y_unit, values, complete)
+        if complete:
+            return
+        previous = x_indices, y_indices, values
+        level_resolution *= 2
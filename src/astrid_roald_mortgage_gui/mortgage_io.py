@@ -0,0 +1,164 @@
+import csv
+import datetime
+import json
+
+from astrid_roald_mortgage_gui.mortgage_objects import AnalysisStartValues, AnalysisVariables, Person, \
+    ScheduleChange
+from astrid_roald_mortgage_gui.mortgage_results import SimulationResult, import_pyarrow
+
+RESULT_FIELDS = ['id', 'date', 'cumulative_cost', 'total_debt', 'total_wealth', 'top_loan']
+SUMMARY_FIELDS = ['id', 'months', 'starting_top_loan', 'mortgage_start_date', 'cumulative_cost', 'total_debt',
+                  'total_wealth']
+# The pyarrow type of every output field, all other fields are floats
+FIELD_TYPES = {'id': 'string', 'date': 'string', 'months': 'int64', 'mortgage_start_date': 'string'}
+
+
+def parse_date(value):
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if str(value).strip().lower() in ('1', 'true', 'yes'):
+        return True
+    if str(value).strip().lower() in ('', '0', 'false', 'no'):
+        return False
+    raise ValueError(f'{value!r} is not a boolean')
+
+
+def person_from_record(record):
+    return Person(parse_date(record['birth_date']), record['name'], float(record['housing_money']),
+                  float(record.get('bsu', 0)), float(record.get('bsu2', 0)),
+                  float(record.get('bsu_left_to_fill', 25000)), float(record.get('bsu2_left_to_fill', 25000)))
+
+
+def get_schedule_changes(records):
+    """ScheduleChanges from a list (or a JSON string of a list) of records with a date, name, value and person."""
+    records = json.loads(records) if isinstance(records, str) else records
+    return [ScheduleChange(parse_date(record['date']), record['name'], float(record['value']), record.get('person'))
+            for record in records]
+
+
+def scenario_from_record(record):
+    """Turn a flat scenario record into (id, number of months, AnalysisVariables, AnalysisStartValues).
+
+    The record holds the AnalysisStartValues fields, the persons as a list (or a JSON string of a list) of Person
+    fields and the AnalysisVariables fields. Interest rates and property value of the variables default to the start
+    values and the housing money per person to the housing money of the persons. An optional schedule_changes list
+    holds later changes of the rates, rent or housing money as read by get_schedule_changes.
+    """
+    persons = record['persons']
+    persons = [person_from_record(person) for person in (json.loads(persons) if isinstance(persons, str)
+                                                         else persons)]
+    analysis_start_values = AnalysisStartValues(persons, parse_date(record['simulation_start_date']),
+                                                float(record['rent']), float(record['property_value']),
+                                                float(record['top_loan_interest_percentage']),
+                                                float(record['mortgage_interest_percentage']))
+    housing_money = {person.name: person.housing_money for person in persons}
+    analysis_variables = AnalysisVariables(sum(housing_money.values()), parse_bool(record.get('pop_bsu', False)),
+                                           parse_bool(record.get('pop_bsu2', False)),
+                                           parse_date(record['mortgage_date']),
+                                           analysis_start_values.property_value,
+                                           analysis_start_values.top_loan_interest_percentage,
+                                           analysis_start_values.mortgage_interest_percentage, housing_money,
+                                           get_schedule_changes(record.get('schedule_changes') or []))
+    return record.get('id'), int(record['months']), analysis_variables, analysis_start_values
+
+
+def read_records(path):
+    with open(path, newline='') as f:
+        if path.endswith('.csv'):
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def read_scenarios(path):
+    for line_number, record in enumerate(read_records(path), 1):
+        try:
+            scenario_id, number_of_months, analysis_variables, analysis_start_values = scenario_from_record(record)
+        except (KeyError, ValueError, TypeError) as e:
+            raise ValueError(f'Invalid scenario {line_number} in {path}: {e!r}')
+        yield scenario_id if scenario_id is not None else line_number, number_of_months, analysis_variables, \
+            analysis_start_values
+
+
+def get_result_rows(scenario_id, result: SimulationResult):
+    dates = [date.isoformat() for date in result.get_dates().tolist()]
+    return [dict(zip(RESULT_FIELDS, row)) for row in zip([scenario_id] * len(result), dates,
+                                                         result.cumulative_cost.tolist(),
+                                                         result.total_debt.tolist(), result.total_wealth.tolist(),
+                                                         result.top_loan.tolist())]
+
+
+def get_summary_rows(scenario_id, result: SimulationResult):
+    mortgage_start_date = None
+    if result.mortgage_start_month is not None:
+        mortgage_start_date = result.get_dates()[result.mortgage_start_month].tolist().isoformat()
+    return [dict(zip(SUMMARY_FIELDS, [scenario_id, len(result), result.starting_top_loan, mortgage_start_date,
+                                      float(result.cumulative_cost[-1]), float(result.total_debt[-1]),
+                                      float(result.total_wealth[-1])]))]
+
+
+class JsonlWriter:
+    def __init__(self, path, fields):
+        self.file = open(path, 'w')
+
+    def write(self, rows):
+        self.file.writelines(json.dumps(row) + '\n' for row in rows)
+
+    def close(self):
+        self.file.close()
+
+
+class CsvWriter:
+    def __init__(self, path, fields):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.DictWriter(self.file, fields)
+        self.writer.writeheader()
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    def __init__(self, path, fields):
+        self.pyarrow = import_pyarrow()
+        self.path = path
+        self.fields = fields
+        # Declared up front, a chunk in which a column is all None would otherwise give it the null type
+        self.schema = self.pyarrow.schema([(field, getattr(self.pyarrow, FIELD_TYPES.get(field, 'float64'))())
+                                           for field in fields])
+        self.writer = None
+
+    def write(self, rows):
+        if not rows:
+            return
+        columns = {field: [row[field] for row in rows] for field in self.fields}
+        if 'id' in columns:
+            # Ids are line numbers for records without one
+            columns['id'] = [None if value is None else str(value) for value in columns['id']]
+        table = self.pyarrow.table(columns, schema=self.schema)
+        if self.writer is None:
+            self.writer = self.pyarrow.parquet.ParquetWriter(self.path, self.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def get_writer(path, fields):
+    if path.endswith('.csv'):
+        return CsvWriter(path, fields)
+    if path.endswith('.parquet'):
+        return ParquetWriter(path, fields)
+    return JsonlWriter(path, fields)
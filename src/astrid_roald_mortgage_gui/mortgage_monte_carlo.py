@@ -0,0 +1,98 @@
+import collections
+import os
+
+import numpy as np
+
+from astrid_roald_mortgage_gui.mortgage_objects import AnalysisStartValues, AnalysisVariables
+from astrid_roald_mortgage_gui.mortgage_batch import calculate_cost_batch
+from astrid_roald_mortgage_gui.mortgage_parallel import get_process_pool
+
+PercentileBands = collections.namedtuple('PercentileBands', ['percentiles', 'time', 'top_loan', 'cumulative_cost',
+                                                             'total_debt', 'total_wealth'])
+
+
+class MeanRevertingRates:
+    """Monthly steps of a Vasicek model, the rate is pulled towards mean with speed per year."""
+
+    def __init__(self, mean, speed=.3, volatility=1.):
+        self.mean = mean
+        self.speed = speed
+        self.volatility = volatility
+
+    def generate(self, start_rate, number_of_paths, number_of_months, random_state):
+        shocks = random_state.standard_normal((number_of_paths, number_of_months)) * self.volatility / 12 ** .5
+        rates = np.empty((number_of_paths, number_of_months))
+        rates[:, 0] = start_rate
+        for month in range(1, number_of_months):
+            rates[:, month] = rates[:, month - 1] + self.speed / 12 * (self.mean - rates[:, month - 1]) \
+                              + shocks[:, month]
+        return rates
+
+
+class RegimeSwitchingRates:
+    """Rates that jump between fixed levels, switching with monthly transition probabilities.
+
+    transition_probabilities[i][j] is the chance to move from levels[i] to levels[j] in one month, every path starts
+    in the level closest to the start rate. The start rate itself is kept as an offset on top of the levels.
+    """
+
+    def __init__(self, levels, transition_probabilities):
+        self.levels = np.asarray(levels, float)
+        self.cumulative_probabilities = np.cumsum(np.asarray(transition_probabilities, float), axis=1)
+
+    def generate(self, start_rate, number_of_paths, number_of_months, random_state):
+        regime = np.full(number_of_paths, np.abs(self.levels - start_rate).argmin())
+        offset = start_rate - self.levels[regime[0]]
+        draws = random_state.random_sample((number_of_paths, number_of_months))
+        regimes = np.empty((number_of_paths, number_of_months), int)
+        regimes[:, 0] = regime
+        for month in range(1, number_of_months):
+            regime = (draws[:, month, None] > self.cumulative_probabilities[regime]).sum(axis=1)
+            regimes[:, month] = np.minimum(regime, len(self.levels) - 1)
+            regime = regimes[:, month]
+        return self.levels[regimes] + offset
+
+
+def simulate_rate_paths(number_of_months, analysis_variables: AnalysisVariables,
+                        analysis_start_values: AnalysisStartValues, rate_model, number_of_paths, seed):
+    """Simulate number_of_paths interest rate paths of the rate model for a single scenario.
+
+    The model drives the mortgage interest, the top loan and BSU interest move along with it keeping their spread.
+    """
+    random_state = np.random.RandomState(seed)
+    mortgage_rates = rate_model.generate(analysis_variables.mortgage_interest_percentage, number_of_paths,
+                                         max(number_of_months, 1), random_state)
+    rate_change = mortgage_rates - analysis_variables.mortgage_interest_percentage
+    interest_rate_paths = (mortgage_rates, analysis_variables.top_loan_interest_percentage + rate_change,
+                           analysis_start_values.bsu_interest_percentage + rate_change)
+    return calculate_cost_batch(number_of_months, [analysis_variables] * number_of_paths, analysis_start_values,
+                                interest_rate_paths)
+
+
+def calculate_percentile_bands(number_of_months, analysis_variables: AnalysisVariables,
+                               analysis_start_values: AnalysisStartValues, rate_model, number_of_paths=10000,
+                               percentiles=(5, 50, 95), seed=0, processes=None, chunk_size=1000):
+    """Monte Carlo percentile bands of the cost, debt and wealth under stochastic interest rates.
+
+    The paths are simulated in chunks spread over a process pool, with processes=1 everything runs in this process.
+    Every chunk gets its own seed derived from seed, so the outcome does not depend on the number of processes.
+    Each band has shape (len(percentiles), months).
+    """
+    chunks = [(number_of_months, analysis_variables, analysis_start_values, rate_model,
+               min(chunk_size, number_of_paths - first_path), seed * 1000003 + chunk)
+              for chunk, first_path in enumerate(range(0, number_of_paths, chunk_size))]
+    processes = processes or os.cpu_count()
+    if processes == 1 or len(chunks) == 1:
+        results = [simulate_rate_paths(*chunk) for chunk in chunks]
+    else:
+        with get_process_pool(min(processes, len(chunks))) as executor:
+            results = list(executor.map(simulate_rate_paths, *zip(*chunks)))
+
+    time = results[0][1]
+    top_loan, cumulative_cost, total_debt, total_wealth = (np.concatenate([result[i] for result in results])
+                                                           for i in [0, 2, 3, 4])
+    # The top loan is nan for paths where the mortgage does not start within the horizon
+    top_loan = np.full(len(percentiles), np.nan) if np.isnan(top_loan).all() else \
+        np.nanpercentile(top_loan, percentiles)
+    return PercentileBands(percentiles, time, top_loan, *(np.percentile(metric, percentiles, axis=0)
+                                                          for metric in [cumulative_cost, total_debt, total_wealth]))
@@ -1,41 +1,103 @@
+import collections
+import collections.abc
 import datetime
 
 
-class Person:
-    def __init__(self, birth_date, name, housing_money, bsu, bsu2, bsu_left_to_fill, bsu2_left_to_fill):
-        self.birth_date = birth_date
-        self.name = name
-        self.housing_money = housing_money
-        self.bsu = bsu
-        self.bsu_active = True
-        self.bsu2 = bsu2
-        self.bsu2_active = True
-        self.bsu_left_to_fill = bsu_left_to_fill
-        self.maximum_bsu_left_to_fill_this_year = 25000
-        self.bsu2_left_to_fill = bsu2_left_to_fill
-
-
-class AnalysisStartValues:
-    def __init__(self, persons, simulation_start_date, rent,
-                 property_value, top_loan_interest_percentage, mortgage_interest_percentage):
-        self.persons = persons
-        self.simulation_start_date = simulation_start_date
-        self.rent = rent
-        self.deposit = 3*rent
-        self.bsu_interest_percentage = 3.75
-        self.property_value = property_value
-        self.top_loan_interest_percentage = top_loan_interest_percentage
-        self.mortgage_interest_percentage = mortgage_interest_percentage
-
-
-class AnalysisVariables:
-    def __init__(self, total_housing_money, pop_bsu, pop_bsu2, mortgage_date, property_value,
-                 top_loan_interest_percentage, mortgage_interest_percentage, housing_money):
-        self.total_housing_money = total_housing_money
-        self.pop_bsu = pop_bsu
-        self.pop_bsu2 = pop_bsu2
-        self.mortgage_date = mortgage_date
-        self.property_value = property_value
-        self.top_loan_interest_percentage = top_loan_interest_percentage
-        self.mortgage_interest_percentage = mortgage_interest_percentage
-        self.housing_money = housing_money
+class Person(collections.namedtuple('Person', ['birth_date', 'name', 'housing_money', 'bsu', 'bsu2',
+                                               'bsu_left_to_fill', 'bsu2_left_to_fill'])):
+    """The starting values of a person. Immutable, a simulation keeps its own state per person."""
+    __slots__ = ()
+    bsu_active = True
+    bsu2_active = True
+    maximum_bsu_left_to_fill_this_year = 25000
+
+
+class AnalysisStartValues(collections.namedtuple('AnalysisStartValues', [
+        'persons', 'simulation_start_date', 'rent', 'property_value', 'top_loan_interest_percentage',
+        'mortgage_interest_percentage'])):
+    __slots__ = ()
+    bsu_interest_percentage = 3.75
+
+    def __new__(cls, persons, simulation_start_date, rent, property_value, top_loan_interest_percentage,
+                mortgage_interest_percentage):
+        return super(AnalysisStartValues, cls).__new__(cls, tuple(persons), simulation_start_date, rent,
+                                                       property_value, top_loan_interest_percentage,
+                                                       mortgage_interest_percentage)
+
+    @property
+    def deposit(self):
+        return 3*self.rent
+
+
+SCHEDULED_INPUTS = ('mortgage_interest_percentage', 'top_loan_interest_percentage', 'bsu_interest_percentage', 'rent',
+                    'housing_money')
+
+
+class ScheduleChange(collections.namedtuple('ScheduleChange', ['date', 'name', 'value', 'person'])):
+    """From the first month on or after date the input name has value, person names whose housing money changes."""
+    __slots__ = ()
+
+    def __new__(cls, date, name, value, person=None):
+        if name not in SCHEDULED_INPUTS:
+            raise ValueError(f'{name!r} cannot be scheduled, only {", ".join(SCHEDULED_INPUTS)} can')
+        if (name == 'housing_money') != (person is not None):
+            raise ValueError('A person is required for a change of housing money and only allowed for that')
+        return super(ScheduleChange, cls).__new__(cls, date, name, value, person)
+
+
+class HousingMoney(collections.abc.Mapping):
+    """The housing money per person name, read like a dict. Immutable and hashable, unlike a dict."""
+    __slots__ = ('_items', '_lookup')
+
+    def __init__(self, housing_money=()):
+        items = housing_money.items() if isinstance(housing_money, collections.abc.Mapping) else housing_money
+        self._items = tuple(sorted(items))
+        self._lookup = dict(self._items)
+
+    def __getitem__(self, name):
+        return self._lookup[name]
+
+    def __iter__(self):
+        return iter(self._lookup)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __hash__(self):
+        return hash(self._items)
+
+    def __eq__(self, other):
+        if isinstance(other, HousingMoney):
+            return self._items == other._items
+        return super(HousingMoney, self).__eq__(other)
+
+    def __repr__(self):
+        return f'HousingMoney({self._lookup!r})'
+
+    def __reduce__(self):
+        return HousingMoney, (self._items,)
+
+
+class AnalysisVariables(collections.namedtuple('AnalysisVariables', [
+        'total_housing_money', 'pop_bsu', 'pop_bsu2', 'mortgage_date', 'property_value',
+        'top_loan_interest_percentage', 'mortgage_interest_percentage', 'housing_money', 'schedule_changes'])):
+    """The inputs that are varied between calculations. Use _replace to derive variations.
+
+    The rates and housing money are the values at the start, schedule_changes holds the ScheduleChanges of fixed rate
+    periods, rent indexation or salary growth after that. The housing money is kept as a HousingMoney, so the
+    variables are hashable and can be used as a key themselves.
+    """
+    __slots__ = ()
+
+    def __new__(cls, total_housing_money, pop_bsu, pop_bsu2, mortgage_date, property_value,
+                top_loan_interest_percentage, mortgage_interest_percentage, housing_money, schedule_changes=()):
+        return super(AnalysisVariables, cls).__new__(cls, total_housing_money, pop_bsu, pop_bsu2, mortgage_date,
+                                                     property_value, top_loan_interest_percentage,
+                                                     mortgage_interest_percentage,
+                                                     housing_money if isinstance(housing_money, HousingMoney) else
+                                                     HousingMoney(housing_money), tuple(schedule_changes))
+
+    @classmethod
+    def _make(cls, iterable):
+        # _replace creates the copy with _make, which would skip the conversions of __new__
+        return cls(*iterable)
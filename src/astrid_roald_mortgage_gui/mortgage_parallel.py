@@ -0,0 +1,46 @@
+import collections
+import concurrent.futures
+import itertools
+import multiprocessing
+import os
+import sys
+
+
+def get_process_pool(workers=None):
+    """A process pool whose workers start as fresh interpreters instead of forks of this process.
+
+    Forking a process that runs threads, such as the GUI with its calculation threads, can deadlock the children on
+    locks held by other threads at the time of the fork. Python 3.6 cannot choose the start method per pool.
+    """
+    if sys.version_info < (3, 7):
+        return concurrent.futures.ProcessPoolExecutor(workers)
+    return concurrent.futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def chunked(iterable, chunk_size):
+    iterator = iter(iterable)
+    chunk = list(itertools.islice(iterator, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(iterator, chunk_size))
+
+
+def map_chunks(function, iterable, chunk_size, workers=None, *args):
+    """Yield function(chunk, *args) for every chunk of iterable, in order, computed on a process pool.
+
+    At most two chunks per worker are in flight, so memory does not grow with the size of the input. With workers=1
+    everything runs in this process.
+    """
+    chunks = chunked(iterable, chunk_size)
+    if workers == 1:
+        for chunk in chunks:
+            yield function(chunk, *args)
+        return
+    with get_process_pool(workers) as executor:
+        in_flight = collections.deque()
+        for chunk in chunks:
+            in_flight.append(executor.submit(function, chunk, *args))
+            if len(in_flight) >= 2 * (workers or os.cpu_count()):
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
@@ -0,0 +1,81 @@
+import bisect
+import datetime
+
+BSU_AGE_LIMIT = datetime.timedelta(days=34*365)
+
+
+class SimulationPlan:
+    """The calendar of a simulation compiled to month indices.
+
+    Month 0 is the simulation start date and month n falls n months later on the same day of the month. Every event
+    the simulation reacts to is known up front: the January months in which a new BSU year starts, the first month
+    in which each person is too old for a BSU, the month in which the mortgage starts and the months in which a
+    scheduled input changes. An event month equal to number_of_months means the event does not happen within the
+    horizon.
+    """
+
+    def __init__(self, simulation_start_date: datetime.date, number_of_months, persons, mortgage_date=None,
+                 schedule_changes=()):
+        if simulation_start_date.day > 28:
+            raise ValueError('This date cannot be consistently increased with one month since the day is more than 28')
+        self.simulation_start_date = simulation_start_date
+        self.number_of_months = max(number_of_months, 1)
+        first_january = (12 - simulation_start_date.month) % 12 + 1
+        self.new_year_months = frozenset(range(first_january, self.number_of_months, 12))
+        self.bsu_cutoff_months = {person.name: self.get_first_month_after(person.birth_date + BSU_AGE_LIMIT)
+                                  for person in persons}
+        self.bsu_cutoffs = {}
+        for name, month in self.bsu_cutoff_months.items():
+            self.bsu_cutoffs.setdefault(month, []).append(name)
+        self.mortgage_date = mortgage_date
+        self.mortgage_start_month = self.number_of_months if mortgage_date is None else \
+            self.get_first_month_from(mortgage_date)
+        # Changes on or before the start date apply from the first simulated month
+        self.schedule_changes = {}
+        for change in sorted(schedule_changes, key=lambda change: change.date):
+            if change.person is not None and change.person not in self.bsu_cutoff_months:
+                raise ValueError(f'The housing money of {change.person!r} is scheduled but there is no such person')
+            month = self.get_first_month_from(change.date)
+            if month < self.number_of_months:
+                self.schedule_changes.setdefault(month, []).append(change)
+        self.schedule_change_months = sorted(self.schedule_changes)
+
+    def get_next_change_month(self, month):
+        """The first month from month on in which a scheduled input changes, number_of_months if none does."""
+        index = bisect.bisect_left(self.schedule_change_months, month)
+        return self.schedule_change_months[index] if index < len(self.schedule_change_months) else \
+            self.number_of_months
+
+    def get_scheduled_values(self, name):
+        """(month, value) of every change of the input name, in order."""
+        return [(month, change.value) for month in self.schedule_change_months
+                for change in self.schedule_changes[month] if change.name == name]
+
+    def get_date(self, month):
+        start = self.simulation_start_date
+        return datetime.date(start.year + (start.month + month - 1) // 12, (start.month + month - 1) % 12 + 1,
+                             start.day)
+
+    def get_first_month_from(self, date: datetime.date):
+        """The first month after the start that falls on or after date."""
+        start = self.simulation_start_date
+        month = (date.year - start.year) * 12 + date.month - start.month
+        if month < 1 or month >= self.number_of_months:
+            return min(max(month, 1), self.number_of_months)
+        return month + 1 if self.get_date(month) < date else month
+
+    def get_first_month_after(self, date: datetime.date):
+        """The first month after the start that falls strictly after date."""
+        start = self.simulation_start_date
+        month = (date.year - start.year) * 12 + date.month - start.month
+        if month < 1 or month >= self.number_of_months:
+            return min(max(month, 1), self.number_of_months)
+        return month + 1 if self.get_date(month) <= date else month
+
+    def with_mortgage_date(self, mortgage_date):
+        plan = SimulationPlan.__new__(SimulationPlan)
+        plan.__dict__.update(self.__dict__)
+        plan.mortgage_date = mortgage_date
+        plan.mortgage_start_month = self.number_of_months if mortgage_date is None else \
+            self.get_first_month_from(mortgage_date)
+        return plan
@@ -0,0 +1,211 @@
+import argparse
+import datetime
+import sys
+
+import numpy as np
+
+from astrid_roald_mortgage_gui.mortgage_batch import BatchPlan, BatchSavingsSimulation
+from astrid_roald_mortgage_gui.mortgage_functions import get_monthly_interest_from_yearly
+from astrid_roald_mortgage_gui.mortgage_io import SUMMARY_FIELDS, get_writer, read_scenarios
+from astrid_roald_mortgage_gui.mortgage_parallel import map_chunks
+from astrid_roald_mortgage_gui.mortgage_plan import SimulationPlan
+
+AGGREGATE_FIELDS = ['month', 'households', 'mortgages', 'total_debt', 'top_loan', 'tax_rebate', 'total_wealth']
+STATISTICS = AGGREGATE_FIELDS[1:]
+
+
+def get_calendar_month(date: datetime.date):
+    return date.year * 12 + date.month - 1
+
+
+class PortfolioSimulation(BatchSavingsSimulation):
+    """The rules of SavingsSimulation applied to a chunk of households that each have their own start values.
+
+    Person state is padded to the largest household of the chunk. Padded persons have no money and no BSU, so they
+    add exact zeros to every sum and the results match the scalar simulation of each household.
+    """
+
+    def __init__(self, scenarios):
+        number_of_households = len(scenarios)
+        start_values_list = [analysis_start_values for _, _, _, analysis_start_values in scenarios]
+        variables_list = [analysis_variables for _, _, analysis_variables, _ in scenarios]
+        if any(variables.schedule_changes for variables in variables_list):
+            raise ValueError('The portfolio simulation assumes constant inputs, scheduled changes are not supported')
+        number_of_persons = max(len(start_values.persons) for start_values in start_values_list)
+        self.persons_per_household = np.array([len(start_values.persons) for start_values in start_values_list])
+        self.real_persons = np.arange(number_of_persons)[None, :] < self.persons_per_household[:, None]
+
+        self.property_value = np.array([variables.property_value for variables in variables_list], float)
+        self.mortgage = np.zeros(number_of_households)
+        self.top_loan = np.zeros(number_of_households)
+        self.rent = np.array([start_values.rent for start_values in start_values_list], float)
+        self.regular_savings = np.array([start_values.deposit for start_values in start_values_list], float)
+
+        def person_state(attribute, dtype=float, padding=0):
+            state = np.full((number_of_households, number_of_persons), padding, dtype=dtype)
+            for household, start_values in enumerate(start_values_list):
+                for person, value in enumerate(getattr(person, attribute) for person in start_values.persons):
+                    state[household, person] = value
+            return state
+
+        self.bsu, self.bsu2 = person_state('bsu'), person_state('bsu2')
+        self.bsu_active = person_state('bsu_active', bool, False)
+        self.bsu2_active = person_state('bsu2_active', bool, False)
+        self.bsu_left_to_fill = person_state('bsu_left_to_fill')
+        self.bsu2_left_to_fill = person_state('bsu2_left_to_fill')
+        self.maximum_bsu_left_to_fill_this_year = person_state('maximum_bsu_left_to_fill_this_year')
+        self.housing_money = np.zeros((number_of_households, number_of_persons))
+        for household, (variables, start_values) in enumerate(zip(variables_list, start_values_list)):
+            for person, name in enumerate(person.name for person in start_values.persons):
+                self.housing_money[household, person] = variables.housing_money[name]
+        self.total_housing_money = np.array([variables.total_housing_money for variables in variables_list], float)
+
+        self.bsu_interest = np.array([get_monthly_interest_from_yearly(start_values.bsu_interest_percentage)
+                                      for start_values in start_values_list])
+        self.mortgage_interest = np.array([get_monthly_interest_from_yearly(variables.mortgage_interest_percentage)
+                                           for variables in variables_list])
+        self.top_loan_interest = np.array([get_monthly_interest_from_yearly(variables.top_loan_interest_percentage)
+                                           for variables in variables_list])
+        self.pop_bsu = np.array([variables.pop_bsu for variables in variables_list], bool)
+        self.pop_bsu2 = np.array([variables.pop_bsu2 for variables in variables_list], bool)
+
+    def get_month_cost(self, got_mortgage, this_months_money):
+        interest_cost = (self.mortgage * self.mortgage_interest + self.top_loan * self.top_loan_interest) * .78
+        mortgage_money = this_months_money - (interest_cost[:, None] * this_months_money
+                                              / self.total_housing_money[:, None])
+        rent_share = np.where(self.real_persons, (self.rent / self.persons_per_household)[:, None], 0.)
+        rent_money = this_months_money - rent_share
+        month_cost = np.where(got_mortgage, interest_cost, self.rent)
+        return month_cost, np.where(got_mortgage[:, None], mortgage_money, rent_money)
+
+
+def simulate_households(scenarios):
+    """Simulate a chunk of households, returns their monthly aggregates and one summary row per household.
+
+    The aggregates are a tuple of the first calendar month and a dict of arrays per statistic, indexed by calendar
+    month relative to the first one. A household only counts towards the months within its own horizon.
+    """
+    simulation = PortfolioSimulation(scenarios)
+    number_of_households = len(scenarios)
+    plans = [SimulationPlan(start_values.simulation_start_date, number_of_months, start_values.persons)
+             for _, number_of_months, _, start_values in scenarios]
+    batch_plan = BatchPlan(plans, [variables.mortgage_date for _, _, variables, _ in scenarios])
+    start_months = np.array([get_calendar_month(plan.simulation_start_date) for plan in plans])
+    horizons = batch_plan.horizons
+
+    first_month = start_months.min()
+    statistics = {statistic: np.zeros(int((start_months + horizons).max() - first_month)) for statistic in STATISTICS}
+    calendar_offsets = start_months - first_month
+    final_cost = np.zeros(number_of_households)
+    final_debt = np.zeros(number_of_households)
+    final_wealth = np.zeros(number_of_households)
+
+    def record(month, cumulative_cost, started_mortgage, tax_rebate):
+        active = month < horizons
+        offsets = calendar_offsets[active] + month
+        debt = np.where(started_mortgage, simulation.mortgage + simulation.top_loan, 0.)
+        wealth = simulation.get_total_wealth(started_mortgage)
+        for statistic, values in [('households', np.ones(number_of_households)), ('mortgages', started_mortgage),
+                                  ('total_debt', debt), ('top_loan', simulation.top_loan),
+                                  ('tax_rebate', tax_rebate), ('total_wealth', wealth)]:
+            np.add.at(statistics[statistic], offsets, values[active])
+        final_cost[active] = cumulative_cost[active]
+        final_debt[active] = debt[active]
+        final_wealth[active] = wealth[active]
+
+    starting_top_loan = simulation.simulate_months(batch_plan, record)
+    mortgage_start_months = batch_plan.mortgage_start_months
+
+    rows = []
+    for household, (scenario_id, _, _, _) in enumerate(scenarios):
+        started = mortgage_start_months[household] < horizons[household]
+        rows.append(dict(zip(SUMMARY_FIELDS, [
+            scenario_id, int(horizons[household]),
+            float(starting_top_loan[household]) if started else None,
+            plans[household].get_date(mortgage_start_months[household]).isoformat() if started else None,
+            float(final_cost[household]), float(final_debt[household]), float(final_wealth[household])])))
+    return (first_month, statistics), rows
+
+
+class PortfolioStatistics:
+    """Monthly statistics of the whole book, summed over the chunks in calendar months."""
+
+    def __init__(self):
+        self.first_month = None
+        self.statistics = {statistic: np.zeros(0) for statistic in STATISTICS}
+
+    def add(self, first_month, statistics):
+        length = len(next(iter(statistics.values())))
+        if self.first_month is None:
+            self.first_month = first_month
+        new_first_month = min(self.first_month, first_month)
+        new_length = max(self.first_month + len(self.statistics['households']), first_month + length) - \
+            new_first_month
+        for statistic, values in statistics.items():
+            total = np.zeros(new_length)
+            old_offset = self.first_month - new_first_month
+            total[old_offset:old_offset + len(self.statistics[statistic])] = self.statistics[statistic]
+            total[first_month - new_first_month:first_month - new_first_month + length] += values
+            self.statistics[statistic] = total
+        self.first_month = new_first_month
+
+    def get_rows(self):
+        rows = []
+        for offset in range(len(self.statistics['households'])):
+            month = self.first_month + offset
+            row = {'month': f'{month // 12:04d}-{month % 12 + 1:02d}'}
+            row.update({statistic: float(self.statistics[statistic][offset]) for statistic in STATISTICS})
+            rows.append(row)
+        return rows
+
+
+def run_portfolio(input_path, aggregate_path, household_path=None, workers=None, chunk_size=1000):
+    """Simulate every household of input_path and write the monthly statistics of the book to aggregate_path.
+
+    Households are read and simulated chunk by chunk on worker processes with map_chunks, so memory is bounded by
+    the chunk size and the number of calendar months. Summaries per household are streamed to household_path as
+    chunks finish, in input order.
+    """
+    portfolio_statistics = PortfolioStatistics()
+    writer = get_writer(household_path, SUMMARY_FIELDS) if household_path else None
+
+    def collect(chunk_result):
+        (first_month, statistics), rows = chunk_result
+        portfolio_statistics.add(first_month, statistics)
+        if writer is not None:
+            writer.write(rows)
+
+    try:
+        for chunk_result in map_chunks(simulate_households, read_scenarios(input_path), chunk_size, workers):
+            collect(chunk_result)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    aggregate_writer = get_writer(aggregate_path, AGGREGATE_FIELDS)
+    try:
+        aggregate_writer.write(portfolio_statistics.get_rows())
+    finally:
+        aggregate_writer.close()
+    return portfolio_statistics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate a book of households, each a scenario with its own '
+                                                 'persons, start values and offers, and write the monthly total '
+                                                 'debt, top loan exposure and tax rebate of the whole book.')
+    parser.add_argument('input', help='households as .jsonl or .csv scenarios')
+    parser.add_argument('output', help='monthly statistics as .jsonl, .csv or .parquet')
+    parser.add_argument('--households', help='also write one summary row per household to this file')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes, default all cores')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='households per worker task')
+    args = parser.parse_args(argv)
+    try:
+        run_portfolio(args.input, args.output, args.households, args.workers, args.chunk_size)
+    except (OSError, ValueError, ImportError) as e:
+        parser.exit(1, f'{parser.prog}: error: {e}\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
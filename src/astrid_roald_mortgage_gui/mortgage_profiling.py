@@ -0,0 +1,127 @@
+"""Opt-in timing of the simulation and GUI phases.
+
+Set the environment variable MORTGAGE_PROFILE=1 (or call enable()) to time every registered phase. Instrumented
+methods are swapped in on the classes only while profiling is enabled, so a disabled profiler costs nothing.
+MORTGAGE_PROFILE_LOG_INTERVAL=<seconds> additionally logs a summary periodically at INFO level.
+"""
+import functools
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PhaseStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = {}
+
+    def record(self, phase, seconds):
+        with self.lock:
+            count, total, longest, _ = self.phases.get(phase, (0, 0., 0., 0.))
+            self.phases[phase] = (count + 1, total + seconds, max(longest, seconds), seconds)
+
+    def reset(self):
+        with self.lock:
+            self.phases.clear()
+
+    def as_dict(self):
+        with self.lock:
+            return {phase: {'count': count, 'total': total, 'mean': total / count, 'max': longest, 'last': last}
+                    for phase, (count, total, longest, last) in self.phases.items()}
+
+    def summary(self):
+        lines = [f'{"phase":32} {"calls":>9} {"total ms":>11} {"mean ms":>9} {"max ms":>9}']
+        for phase, stats in sorted(self.as_dict().items(), key=lambda item: -item[1]['total']):
+            lines.append(f'{phase:32} {stats["count"]:9d} {stats["total"] * 1000:11.2f} {stats["mean"] * 1000:9.3f} '
+                         f'{stats["max"] * 1000:9.3f}')
+        return '\n'.join(lines)
+
+    def status_line(self, phases=None):
+        """The last duration of each phase in one line, for a status bar."""
+        stats = self.as_dict()
+        return ', '.join(f'{phase} {stats[phase]["last"] * 1000:.1f} ms' for phase in (phases or sorted(stats))
+                         if phase in stats)
+
+
+stats = PhaseStats()
+instrumented_methods = []
+enabled = False
+log_timer = None
+
+
+def timed(phase, function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stats.record(phase, time.perf_counter() - start)
+    return wrapper
+
+
+def instrument(cls, method_name, phase):
+    """Register cls.method_name to be timed as phase while profiling is enabled."""
+    instrumented_methods.append((cls, method_name, phase, cls.__dict__.get(method_name)))
+    if enabled:
+        setattr(cls, method_name, timed(phase, getattr(cls, method_name)))
+
+
+def enable():
+    global enabled
+    if enabled:
+        return
+    enabled = True
+    for cls, method_name, phase, _ in instrumented_methods:
+        setattr(cls, method_name, timed(phase, getattr(cls, method_name)))
+
+
+def disable():
+    global enabled
+    if not enabled:
+        return
+    enabled = False
+    stop_periodic_log()
+    for cls, method_name, phase, own_method in reversed(instrumented_methods):
+        if own_method is None:
+            delattr(cls, method_name)
+        else:
+            setattr(cls, method_name, own_method)
+
+
+def start_periodic_log(interval):
+    global log_timer
+
+    def log_summary():
+        global log_timer
+        logger.info('Profile since the start\n%s', stats.summary())
+        log_timer = threading.Timer(interval, log_summary)
+        log_timer.daemon = True
+        log_timer.start()
+
+    stop_periodic_log()
+    log_timer = threading.Timer(interval, log_summary)
+    log_timer.daemon = True
+    log_timer.start()
+
+
+def stop_periodic_log():
+    global log_timer
+    if log_timer is not None:
+        log_timer.cancel()
+        log_timer = None
+
+
+def enable_from_environment():
+    if os.environ.get('MORTGAGE_PROFILE', '').lower() in ('1', 'true', 'yes'):
+        enable()
+        if os.environ.get('MORTGAGE_PROFILE_LOG_INTERVAL'):
+            if not logging.getLogger().handlers:
+                logging.basicConfig(level=logging.INFO)
+            start_periodic_log(float(os.environ['MORTGAGE_PROFILE_LOG_INTERVAL']))
+
+
+enable_from_environment()
@@ -0,0 +1,87 @@
+import csv
+import datetime
+
+import numpy as np
+
+
+def import_pyarrow():
+    """pyarrow with its parquet module, which is an optional dependency."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('Writing parquet files requires pyarrow, install it with "pip install pyarrow"')
+    return pyarrow
+
+
+class SimulationResult:
+    """Columnar monthly output of a simulation, backed by preallocated NumPy arrays.
+
+    Month i of every series belongs to time[i], a datetime64[M] that falls on the day of the month of the simulation
+    start date. Slicing a result with result[start:stop] returns a view on the same arrays without copying. The
+    mortgage_start_month of a slice is relative to its first month, and None if the mortgage started before it.
+    """
+
+    def __init__(self, time, day, person_names, cumulative_cost, total_debt, total_wealth, top_loan, bsu, bsu2,
+                 mortgage_start_month=None, starting_top_loan=None):
+        self.time = time
+        self.day = day
+        self.person_names = person_names
+        self.cumulative_cost = cumulative_cost
+        self.total_debt = total_debt
+        self.total_wealth = total_wealth
+        self.top_loan = top_loan
+        self.bsu = bsu
+        self.bsu2 = bsu2
+        self.mortgage_start_month = mortgage_start_month
+        self.starting_top_loan = starting_top_loan
+
+    @classmethod
+    def allocate(cls, start_date: datetime.date, number_of_months, person_names):
+        number_of_months = max(number_of_months, 1)
+        time = np.datetime64(start_date, 'M') + np.arange(number_of_months)
+        return cls(time, start_date.day, list(person_names), np.zeros(number_of_months), np.zeros(number_of_months),
+                   np.zeros(number_of_months), np.zeros(number_of_months),
+                   np.zeros((number_of_months, len(person_names))), np.zeros((number_of_months, len(person_names))))
+
+    def __len__(self):
+        return len(self.time)
+
+    def __getitem__(self, months):
+        if not isinstance(months, slice) or months.step not in (None, 1):
+            raise TypeError('A simulation result can only be sliced with a contiguous slice of months')
+        start, stop, _ = months.indices(len(self))
+        mortgage_start_month, starting_top_loan = None, None
+        if self.mortgage_start_month is not None and self.mortgage_start_month < stop:
+            starting_top_loan = self.starting_top_loan
+            if self.mortgage_start_month >= start:
+                mortgage_start_month = self.mortgage_start_month - start
+        return SimulationResult(self.time[months], self.day, self.person_names, self.cumulative_cost[months],
+                                self.total_debt[months], self.total_wealth[months], self.top_loan[months],
+                                self.bsu[months], self.bsu2[months], mortgage_start_month, starting_top_loan)
+
+    def get_dates(self):
+        return self.time.astype('datetime64[D]') + (self.day - 1)
+
+    def to_lists(self):
+        """The output of calculate_cost: top loan, dates, cumulative cost, total debt and total wealth as lists."""
+        return (self.starting_top_loan, self.get_dates().tolist(), self.cumulative_cost.tolist(),
+                self.total_debt.tolist(), self.total_wealth.tolist())
+
+    def get_columns(self):
+        columns = [('date', self.get_dates()), ('cumulative_cost', self.cumulative_cost),
+                   ('total_debt', self.total_debt), ('total_wealth', self.total_wealth), ('top_loan', self.top_loan)]
+        for i, name in enumerate(self.person_names):
+            columns += [(f'bsu_{name}', self.bsu[:, i]), (f'bsu2_{name}', self.bsu2[:, i])]
+        return columns
+
+    def to_csv(self, path):
+        columns = self.get_columns()
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow([name for name, _ in columns])
+            writer.writerows(zip(*(values.tolist() for _, values in columns)))
+
+    def to_parquet(self, path):
+        pyarrow = import_pyarrow()
+        pyarrow.parquet.write_table(pyarrow.table({name: values for name, values in self.get_columns()}), path)
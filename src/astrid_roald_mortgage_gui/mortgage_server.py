@@ -0,0 +1,306 @@
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import os
+import sys
+import time
+
+from astrid_roald_mortgage_gui.mortgage_cache import get_scenario_key
+from astrid_roald_mortgage_gui.mortgage_functions import simulate, sweep_mortgage_dates
+from astrid_roald_mortgage_gui.mortgage_io import get_result_rows, get_summary_rows, parse_date, \
+    scenario_from_record
+from astrid_roald_mortgage_gui.mortgage_parallel import get_process_pool
+from astrid_roald_mortgage_gui.mortgage_plan import SimulationPlan
+
+MAX_BODY_SIZE = 1024 * 1024
+MAX_MONTHS = 1200
+STATUS_TEXTS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+Job = collections.namedtuple('Job', ['endpoint', 'scenario', 'mortgage_dates', 'summary', 'future'])
+
+
+def run_job(endpoint, scenario, mortgage_dates, summary):
+    scenario_id, number_of_months, analysis_variables, analysis_start_values = scenario
+    get_rows = get_summary_rows if summary else get_result_rows
+    if endpoint == 'calculate_cost':
+        return get_rows(scenario_id, simulate(number_of_months, analysis_variables, analysis_start_values))
+    rows = []
+    for mortgage_date, result in zip(mortgage_dates, sweep_mortgage_dates(number_of_months, analysis_variables,
+                                                                          analysis_start_values, mortgage_dates)):
+        for row in get_rows(scenario_id, result):
+            row['mortgage_date'] = mortgage_date.isoformat()
+            rows.append(row)
+    return rows
+
+
+def run_batch(jobs):
+    """Run a batch of (endpoint, scenario, mortgage dates, summary) jobs, identical jobs are only simulated once.
+
+    Returns a (status, content) pair per job: 200 and the rows, or the status and message of the error of that job,
+    so a failing job does not fail the other jobs of its batch.
+    """
+    outcomes_per_key = {}
+    outcomes = []
+    for endpoint, scenario, mortgage_dates, summary in jobs:
+        scenario_id, number_of_months, analysis_variables, analysis_start_values = scenario
+        key = (endpoint, number_of_months, get_scenario_key(analysis_variables, analysis_start_values),
+               tuple(mortgage_dates), summary)
+        if key not in outcomes_per_key:
+            try:
+                outcomes_per_key[key] = 200, run_job(endpoint, scenario, mortgage_dates, summary)
+            except (KeyError, ValueError, TypeError, ZeroDivisionError) as e:
+                # Division by zero comes from scenarios without any housing money
+                outcomes_per_key[key] = 400, f'Invalid scenario: {e!r}'
+            except Exception as e:
+                outcomes_per_key[key] = 500, repr(e)
+        status, content = outcomes_per_key[key]
+        outcomes.append((status, [dict(row, id=scenario_id) for row in content] if status == 200 else content))
+    return outcomes
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super(HttpError, self).__init__(message)
+        self.status = status
+
+
+class ServerMetrics:
+    """Request counts and latencies of the server, latencies over the most recent requests."""
+
+    def __init__(self, window=1000):
+        self.started = time.time()
+        self.requests = collections.Counter()
+        self.responses = collections.Counter()
+        self.rejected = 0
+        self.batches = 0
+        self.batched_jobs = 0
+        self.latencies = collections.deque(maxlen=window)
+
+    def as_dict(self, pending, in_flight_batches):
+        latencies = sorted(self.latencies)
+
+        def percentile(fraction):
+            return latencies[min(int(fraction * len(latencies)), len(latencies) - 1)] * 1000 if latencies else None
+        return {'uptime_seconds': time.time() - self.started, 'requests': dict(self.requests),
+                'responses': {str(status): count for status, count in self.responses.items()},
+                'rejected': self.rejected, 'pending': pending, 'in_flight_batches': in_flight_batches,
+                'batches': self.batches,
+                'mean_batch_size': self.batched_jobs / self.batches if self.batches else None,
+                'latency_ms': {'p50': percentile(.5), 'p95': percentile(.95), 'p99': percentile(.99),
+                               'max': latencies[-1] * 1000 if latencies else None}}
+
+
+class SimulationServer:
+    """A local HTTP server for the simulation engine.
+
+    POST /calculate_cost takes a scenario record as read by the batch CLI, POST /sweep_mortgage_dates additionally
+    takes a list of mortgage_dates and GET /metrics returns the ServerMetrics. Add "summary": true to a request for
+    one row per result instead of one per month. Results are streamed back as JSON lines. Scenarios of more than
+    MAX_MONTHS months are rejected with 400.
+
+    Requests that arrive within batch_window seconds of each other are collected into one batch of at most
+    max_batch_size jobs, which runs as a single task on the worker pool. At most one batch per worker runs at a
+    time and at most max_pending jobs wait for a batch; beyond that requests are rejected with 503.
+    """
+
+    def __init__(self, workers=None, batch_window=.005, max_batch_size=64, max_pending=1024):
+        self.workers = workers
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.max_pending = max_pending
+        self.metrics = ServerMetrics()
+        self.executor = None
+        self.queue = None
+        self.batch_slots = None
+        self.in_flight_batches = 0
+        self.server = None
+        self.batcher = None
+
+    async def start(self, host='127.0.0.1', port=8765):
+        # Without multiple workers everything runs in this process, which skips pickling the scenarios
+        self.executor = concurrent.futures.ThreadPoolExecutor(1) if self.workers == 1 else \
+            get_process_pool(self.workers)
+        self.queue = asyncio.Queue(self.max_pending)
+        self.batch_slots = asyncio.Semaphore(self.workers or os.cpu_count())
+        self.batcher = asyncio.ensure_future(self.collect_batches())
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.batcher.cancel()
+        self.executor.shutdown(wait=False)
+
+    async def collect_batches(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Waiting for a free worker here lets the queue fill up, which is where backpressure kicks in
+            await self.batch_slots.acquire()
+            asyncio.ensure_future(self.run_batch(batch))
+
+    async def run_batch(self, batch):
+        self.in_flight_batches += 1
+        self.metrics.batches += 1
+        self.metrics.batched_jobs += len(batch)
+        try:
+            outcomes = await asyncio.get_event_loop().run_in_executor(
+                self.executor, run_batch, [(job.endpoint, job.scenario, job.mortgage_dates, job.summary)
+                                           for job in batch])
+            for job, (status, content) in zip(batch, outcomes):
+                if job.future.cancelled():
+                    continue
+                if status == 200:
+                    job.future.set_result(content)
+                else:
+                    job.future.set_exception(HttpError(status, content))
+        except Exception as e:
+            for job in batch:
+                if not job.future.done():
+                    job.future.set_exception(e)
+        finally:
+            self.in_flight_batches -= 1
+            self.batch_slots.release()
+
+    async def submit(self, endpoint, record):
+        try:
+            scenario = scenario_from_record(record)
+            mortgage_dates = [parse_date(date) for date in record.get('mortgage_dates', [])] \
+                if endpoint == 'sweep_mortgage_dates' else []
+            # Compiling the plan rejects start dates and schedules the engine cannot simulate before they are queued
+            _, number_of_months, analysis_variables, analysis_start_values = scenario
+            if not 1 <= number_of_months <= MAX_MONTHS:
+                raise ValueError(f'months must be between 1 and {MAX_MONTHS}, not {number_of_months}')
+            SimulationPlan(analysis_start_values.simulation_start_date, number_of_months,
+                           analysis_start_values.persons, analysis_variables.mortgage_date,
+                           analysis_variables.schedule_changes)
+        except (KeyError, ValueError, TypeError) as e:
+            raise HttpError(400, f'Invalid scenario: {e!r}')
+        future = asyncio.get_event_loop().create_future()
+        try:
+            self.queue.put_nowait(Job(endpoint, scenario, mortgage_dates, bool(record.get('summary', False)),
+                                      future))
+        except asyncio.QueueFull:
+            self.metrics.rejected += 1
+            raise HttpError(503, 'Too many pending requests, retry later')
+        return await future
+
+    async def read_request(self, reader):
+        request_line = (await reader.readline()).decode('latin-1').split()
+        if len(request_line) != 3:
+            raise HttpError(400, 'Malformed request line')
+        method, path, _ = request_line
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HttpError(400, 'The Content-Length is not a number')
+        if length < 0:
+            raise HttpError(400, 'The Content-Length is negative')
+        if length > MAX_BODY_SIZE:
+            raise HttpError(413, f'The body is larger than {MAX_BODY_SIZE} bytes')
+        body = await reader.readexactly(length) if length else b''
+        return method, path, body
+
+    def write_head(self, writer, status, headers):
+        self.metrics.responses[status] += 1
+        if status == 503:
+            headers['Retry-After'] = '1'
+        head = f'HTTP/1.1 {status} {STATUS_TEXTS[status]}\r\nConnection: close\r\n' + \
+            ''.join(f'{name}: {value}\r\n' for name, value in headers.items())
+        writer.write((head + '\r\n').encode('latin-1'))
+
+    async def write_json(self, writer, status, content):
+        body = json.dumps(content).encode()
+        self.write_head(writer, status, {'Content-Type': 'application/json', 'Content-Length': len(body)})
+        writer.write(body)
+        await writer.drain()
+
+    async def stream_rows(self, writer, rows, rows_per_chunk=120):
+        self.write_head(writer, 200, {'Content-Type': 'application/x-ndjson', 'Transfer-Encoding': 'chunked'})
+        for first in range(0, len(rows), rows_per_chunk):
+            data = ''.join(json.dumps(row) + '\n' for row in rows[first:first + rows_per_chunk]).encode()
+            writer.write(b'%x\r\n%s\r\n' % (len(data), data))
+            # Waits while a slow client has not read what was sent so far
+            await writer.drain()
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        start = time.perf_counter()
+        try:
+            method, path, body = await self.read_request(reader)
+            endpoint = path.strip('/').split('?')[0]
+            self.metrics.requests[endpoint] += 1
+            if endpoint == 'metrics':
+                await self.write_json(writer, 200, self.metrics.as_dict(self.queue.qsize(), self.in_flight_batches))
+                return
+            if endpoint not in ('calculate_cost', 'sweep_mortgage_dates'):
+                raise HttpError(404, f'Unknown endpoint {path}')
+            if method != 'POST':
+                raise HttpError(405, f'{endpoint} only accepts POST')
+            try:
+                record = json.loads(body.decode())
+            except ValueError as e:
+                raise HttpError(400, f'Invalid JSON: {e}')
+            if not isinstance(record, dict):
+                raise HttpError(400, 'The body must be a JSON object')
+            await self.stream_rows(writer, await self.submit(endpoint, record))
+            self.metrics.latencies.append(time.perf_counter() - start)
+        except HttpError as e:
+            await self.write_json(writer, e.status, {'error': str(e)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            await self.write_json(writer, 500, {'error': repr(e)})
+        finally:
+            writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the simulation engine over HTTP on this machine. POST '
+                                                 'scenarios to /calculate_cost or /sweep_mortgage_dates, GET '
+                                                 '/metrics for request counts and latencies.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes, default all cores')
+    parser.add_argument('--batch-window', type=float, default=5, help='milliseconds to collect a batch')
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-pending', type=int, default=1024, help='requests waiting before rejecting new ones')
+    args = parser.parse_args(argv)
+
+    server = SimulationServer(args.workers, args.batch_window / 1000, args.max_batch_size, args.max_pending)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(server.start(args.host, args.port))
+    print(f'Serving on http://{args.host}:{args.port}')
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(server.stop())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+import collections
+import datetime
+
+import numpy as np
+
+from astrid_roald_mortgage_gui.mortgage_objects import AnalysisStartValues, AnalysisVariables
+from astrid_roald_mortgage_gui.mortgage_functions import SavingsPhase, simulate
+from astrid_roald_mortgage_gui.mortgage_heatmap import HEATMAP_INPUTS
+from astrid_roald_mortgage_gui.mortgage_results import SimulationResult
+
+SolveResult = collections.namedtuple('SolveResult', ['value', 'metric_value', 'analysis_variables', 'bracket',
+                                                     'simulations'])
+SOLVER_INPUTS = HEATMAP_INPUTS
+
+
+def get_final_cost(result: SimulationResult):
+    return result.cumulative_cost[-1]
+
+
+def get_final_wealth(result: SimulationResult):
+    return result.total_wealth[-1]
+
+
+def get_final_debt(result: SimulationResult):
+    return result.total_debt[-1]
+
+
+def get_starting_top_loan(result: SimulationResult):
+    # Without a mortgage within the horizon there is no top loan to speak of
+    return np.inf if result.starting_top_loan is None else result.starting_top_loan
+
+
+def get_debt_at(date: datetime.date):
+    """A metric of the total debt in the first month on or after date."""
+    def get_debt(result: SimulationResult):
+        month = np.searchsorted(result.get_dates(), np.datetime64(date, 'D'))
+        return result.total_debt[min(month, len(result) - 1)]
+    return get_debt
+
+
+METRICS = collections.OrderedDict([
+    ('final cost', get_final_cost),
+    ('final wealth', get_final_wealth),
+    ('final debt', get_final_debt),
+    ('starting top loan', get_starting_top_loan),
+])
+
+
+def get_default_bracket(input_name, number_of_months, analysis_variables: AnalysisVariables,
+                        analysis_start_values: AnalysisStartValues):
+    value = SOLVER_INPUTS[input_name][1](analysis_variables, analysis_start_values)
+    if input_name.startswith('mortgage date'):
+        return 1, max(number_of_months - 1, 1)
+    if input_name.endswith('percentage'):
+        return 0, max(value * 2, 20)
+    # No housing money at all cannot pay any interest
+    unit = SOLVER_INPUTS[input_name][2]
+    return unit if input_name == 'total housing money' else 0, max(value * 3, unit)
+
+
+class Evaluator:
+    """Simulates a scenario for values of one input, warm started from a shared savings phase where possible."""
+
+    def __init__(self, number_of_months, analysis_variables: AnalysisVariables,
+                 analysis_start_values: AnalysisStartValues, input_name, metric):
+        self.number_of_months = number_of_months
+        self.analysis_variables = analysis_variables
+        self.analysis_start_values = analysis_start_values
+        self.set_input = SOLVER_INPUTS[input_name][0]
+        self.metric = METRICS[metric] if isinstance(metric, str) else metric
+        # The housing money is the only input that changes the savings phase
+        self.savings_phase = None if input_name == 'total housing money' else \
+            SavingsPhase(number_of_months, analysis_variables, analysis_start_values)
+        self.metric_values = {}
+
+    @property
+    def simulations(self):
+        return len(self.metric_values)
+
+    def get_variables(self, value):
+        return self.set_input(self.analysis_variables, self.analysis_start_values, value)
+
+    def evaluate(self, value):
+        if value not in self.metric_values:
+            analysis_variables = self.get_variables(value)
+            if self.savings_phase is None:
+                result = simulate(self.number_of_months, analysis_variables, self.analysis_start_values)
+            else:
+                result = self.savings_phase.simulate(analysis_variables)
+            self.metric_values[value] = self.metric(result)
+        return self.metric_values[value]
+
+
+def solve(number_of_months, analysis_variables: AnalysisVariables, analysis_start_values: AnalysisStartValues,
+          input_name, metric, target, bracket=None, tolerance=None, max_simulations=100):
+    """Find the value of input_name at which metric crosses target by bisection.
+
+    metric is the name of one of METRICS or a function of a SimulationResult and has to be monotone in the input
+    within bracket. The solution is the value closest to the crossing for which metric <= target, within tolerance
+    (by default the lattice unit of the input). Raises ValueError when target is not bracketed.
+    """
+    set_input, _, unit = SOLVER_INPUTS[input_name]
+    tolerance = tolerance or unit
+    low, high = bracket or get_default_bracket(input_name, number_of_months, analysis_variables,
+                                               analysis_start_values)
+    evaluator = Evaluator(number_of_months, analysis_variables, analysis_start_values, input_name, metric)
+    low_reached = evaluator.evaluate(low) <= target
+    high_reached = evaluator.evaluate(high) <= target
+    if low_reached == high_reached:
+        raise ValueError(f'The target {target} is not crossed between {input_name} {low} and {high}')
+
+    while high - low > tolerance and evaluator.simulations < max_simulations:
+        middle = round((low + high) / 2 / tolerance) * tolerance
+        if middle <= low or middle >= high:
+            break
+        if (evaluator.evaluate(middle) <= target) == low_reached:
+            low = middle
+        else:
+            high = middle
+
+    value = low if low_reached else high
+    analysis_variables = evaluator.get_variables(value)
+    return SolveResult(value, evaluator.evaluate(value), analysis_variables, (low, high), evaluator.simulations)
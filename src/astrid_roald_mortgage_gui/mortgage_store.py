@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+from astrid_roald_mortgage_gui.mortgage_objects import AnalysisStartValues, AnalysisVariables
+from astrid_roald_mortgage_gui.mortgage_functions import ENGINE_VERSION, simulate
+from astrid_roald_mortgage_gui.mortgage_cache import get_scenario_key
+from astrid_roald_mortgage_gui.mortgage_io import get_schedule_changes, parse_date
+from astrid_roald_mortgage_gui.mortgage_results import SimulationResult
+
+DEFAULT_STORE_DIRECTORY = os.path.join(os.path.expanduser('~'), '.astrid-roald-mortgage', 'store')
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    engine_version INTEGER NOT NULL,
+    start_date TEXT NOT NULL,
+    months INTEGER NOT NULL,
+    person_names TEXT NOT NULL,
+    mortgage_start_month INTEGER,
+    starting_top_loan REAL,
+    variables TEXT NOT NULL,
+    label TEXT,
+    saved INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    start_values TEXT
+)
+"""
+
+
+def get_scenario_hash(number_of_months, analysis_variables: AnalysisVariables,
+                      analysis_start_values: AnalysisStartValues):
+    """A content hash of everything a result depends on, including the engine version."""
+    content = repr((ENGINE_VERSION, max(number_of_months, 1), get_scenario_key(analysis_variables,
+                                                                               analysis_start_values)))
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def get_start_values_hash(analysis_start_values: AnalysisStartValues):
+    return hashlib.sha256(repr(analysis_start_values).encode()).hexdigest()
+
+
+def get_variables_record(analysis_variables: AnalysisVariables):
+    record = analysis_variables._asdict()
+    record['mortgage_date'] = analysis_variables.mortgage_date.isoformat()
+    record['housing_money'] = dict(analysis_variables.housing_money)
+    record['schedule_changes'] = [dict(change._asdict(), date=change.date.isoformat())
+                                  for change in analysis_variables.schedule_changes]
+    return record
+
+
+def variables_from_record(record):
+    return AnalysisVariables(**dict(record, mortgage_date=parse_date(record['mortgage_date']),
+                                    schedule_changes=get_schedule_changes(record.get('schedule_changes', []))))
+
+
+class ResultStore:
+    """Simulation results on disk, an SQLite index next to one array file per result.
+
+    Results are keyed by get_scenario_hash, so a result is only reused by the engine version that computed it.
+    Each array file holds the cost, debt, wealth, top loan and BSU series as rows of one .npy array, which is read
+    back memory mapped: loading a result does not copy or even read the series until they are used. Results added
+    by the GUI are marked as saved so they can be shown again in the next session with the same start values.
+    """
+
+    def __init__(self, directory=DEFAULT_STORE_DIRECTORY):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, 'arrays'), exist_ok=True)
+        # Worker processes of batch runs write to the same store, wait for each other instead of failing
+        self.connection = sqlite3.connect(os.path.join(directory, 'index.sqlite'), timeout=60)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(SCHEMA)
+        # Stores created before saved results were tied to their start values lack the column
+        columns = [column[1] for column in self.connection.execute('PRAGMA table_info(results)')]
+        if 'start_values' not in columns:
+            self.connection.execute('ALTER TABLE results ADD COLUMN start_values TEXT')
+        self.connection.commit()
+
+    def get_array_path(self, key):
+        return os.path.join(self.directory, 'arrays', f'{key}.npy')
+
+    def __contains__(self, key):
+        return self.connection.execute('SELECT 1 FROM results WHERE key = ?', (key,)).fetchone() is not None
+
+    def save(self, number_of_months, analysis_variables: AnalysisVariables,
+             analysis_start_values: AnalysisStartValues, result: SimulationResult, label=None, saved=False):
+        key = get_scenario_hash(number_of_months, analysis_variables, analysis_start_values)
+        if key in self:
+            if saved:
+                self.connection.execute('UPDATE results SET saved = 1, label = ?, start_values = ? WHERE key = ?',
+                                        (label, get_start_values_hash(analysis_start_values), key))
+                self.connection.commit()
+            return key
+        series = np.vstack([result.cumulative_cost, result.total_debt, result.total_wealth, result.top_loan,
+                            result.bsu.T, result.bsu2.T])
+        # Written under a temporary name first so a reader never sees half an array
+        temporary_path = self.get_array_path(key) + f'.{os.getpid()}.tmp'
+        with open(temporary_path, 'wb') as f:
+            np.save(f, series)
+        os.replace(temporary_path, self.get_array_path(key))
+        self.connection.execute(
+            'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (key, ENGINE_VERSION, str(result.get_dates()[0]), len(result), json.dumps(result.person_names),
+             None if result.mortgage_start_month is None else int(result.mortgage_start_month),
+             None if result.starting_top_loan is None else float(result.starting_top_loan),
+             json.dumps(get_variables_record(analysis_variables)), label, int(saved), time.time(),
+             get_start_values_hash(analysis_start_values)))
+        self.connection.commit()
+        return key
+
+    def load(self, key):
+        """The memory mapped SimulationResult of key, None if it is not in the store or its array is unreadable."""
+        row = self.connection.execute('SELECT start_date, person_names, mortgage_start_month, starting_top_loan '
+                                      'FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        start_date, person_names, mortgage_start_month, starting_top_loan = row
+        start_date = parse_date(start_date)
+        person_names = json.loads(person_names)
+        try:
+            series = np.load(self.get_array_path(key), mmap_mode='r')
+        except (OSError, ValueError):
+            # The array was deleted or damaged outside of the store, forget the result so it is simulated again
+            self.remove(key)
+            return None
+        persons = len(person_names)
+        months = np.datetime64(start_date, 'M') + np.arange(series.shape[1])
+        return SimulationResult(months, start_date.day, person_names, series[0], series[1], series[2], series[3],
+                                series[4:4 + persons].T, series[4 + persons:].T, mortgage_start_month,
+                                starting_top_loan)
+
+    def simulate(self, number_of_months, analysis_variables: AnalysisVariables,
+                 analysis_start_values: AnalysisStartValues):
+        """The stored result of the scenario, simulated and stored first if it is not there yet."""
+        result = self.load(get_scenario_hash(number_of_months, analysis_variables, analysis_start_values))
+        if result is None:
+            result = simulate(number_of_months, analysis_variables, analysis_start_values)
+            self.save(number_of_months, analysis_variables, analysis_start_values, result)
+        return result
+
+    def get_saved_keys(self, analysis_start_values: AnalysisStartValues):
+        rows = self.connection.execute('SELECT key FROM results WHERE saved = 1 AND start_values = ?',
+                                       (get_start_values_hash(analysis_start_values),)).fetchall()
+        return [row[0] for row in rows]
+
+    def get_saved(self, analysis_start_values: AnalysisStartValues):
+        """(key, label, AnalysisVariables) of every saved result of this engine version and these start values,
+        oldest first."""
+        rows = self.connection.execute('SELECT key, label, variables FROM results WHERE saved = 1 AND '
+                                       'engine_version = ? AND start_values = ? ORDER BY created',
+                                       (ENGINE_VERSION, get_start_values_hash(analysis_start_values))).fetchall()
+        return [(key, label, variables_from_record(json.loads(variables))) for key, label, variables in rows]
+
+    def remove_saved(self, analysis_start_values: AnalysisStartValues):
+        """Delete the saved results of these start values from the store, of every engine version."""
+        self.remove(*self.get_saved_keys(analysis_start_values))
+
+    def remove(self, *keys):
+        self.connection.executemany('DELETE FROM results WHERE key = ?', [(key,) for key in keys])
+        self.connection.commit()
+        for key in keys:
+            if os.path.exists(self.get_array_path(key)):
+                os.remove(self.get_array_path(key))
+
+    def close(self):
+        self.connection.close()